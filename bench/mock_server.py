@@ -0,0 +1,221 @@
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+# Servidor local que imita os endpoints do sakuramangas.org usados por
+# code/manga.py e code/cap.py, com latência, banda e taxa de erros ajustáveis
+
+TOKEN = 'token-benchmark'
+
+class MockSite:
+    """
+    Catálogo sintético: mangás 1..N, cada um com capítulos 1..M de P páginas
+    """
+    def __init__(self, mangas, chapters, pages, image_size, latency, bandwidth, error_rate, seed=0):
+        self.mangas = mangas
+        self.chapters = chapters
+        self.pages = pages
+        self.image_size = image_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.bytes_sent = 0
+
+    def count(self, endpoint, size):
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+            self.bytes_sent += size
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def chapter_id(self, manga, number):
+        return manga * 100000 + number
+
+    def split_chapter_id(self, chapter_id):
+        return divmod(int(chapter_id), 100000)
+
+    def image(self, chapter_id, page):
+        # JPEG sintético: marcador de início, conteúdo determinístico, marcador de fim
+        seed = f'{chapter_id}:{page}'.encode()
+        body_size = max(0, self.image_size - 4)
+        body = (seed * (body_size // len(seed) + 1))[:body_size]
+        return b'\xff\xd8' + body + b'\xff\xd9'
+
+    def chapter_list(self, base_url, manga, offset, limit):
+        items = []
+        first = self.chapters - offset
+        for number in range(first, max(0, first - limit), -1):
+            items.append(
+                '<div class="capitulo-item">'
+                f'<span class="num-capitulo" data-chapter="{number}">'
+                f'<a href="{base_url}/ler/manga-{manga}/{number}/">Capítulo {number}</a></span>'
+                f'<span class="cap-titulo">Título {number}</span>'
+                f'<span class="scan-nome">Scan {number % 3}</span>'
+                '</div>'
+            )
+        return ''.join(items)
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def send_body(self, status, body, content_type='text/html; charset=utf-8', headers=None, endpoint=None):
+            if site.latency:
+                time.sleep(site.latency)
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            if self.command == 'HEAD':
+                body = b''
+            if site.bandwidth and body:
+                # Entrega em blocos para simular a banda configurada
+                block = max(1024, int(site.bandwidth / 20))
+                for start in range(0, len(body), block):
+                    self.wfile.write(body[start:start + block])
+                    time.sleep(min(len(body) - start, block) / site.bandwidth)
+            else:
+                self.wfile.write(body)
+            site.count(endpoint or urlparse(self.path).path, len(body))
+
+        def fail(self, endpoint):
+            self.send_body(503, b'erro simulado', endpoint=endpoint + ' (erro)')
+
+        def do_HEAD(self):
+            self.do_GET()
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == '/__stats':
+                with site.lock:
+                    stats = {'requests': dict(site.counts), 'bytes': site.bytes_sent}
+                body = json.dumps(stats).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            parts = path.strip('/').split('/')
+            if parts[0] == 'obras' and len(parts) >= 2:
+                if site.should_fail():
+                    return self.fail('/obras/')
+                manga = int(parts[1].rsplit('-', 1)[-1])
+                html = f'<html><head><meta manga-id="{manga}"><meta token="{TOKEN}"></head><body></body></html>'
+                return self.send_body(200, html.encode(), endpoint='/obras/')
+
+            if parts[0] == 'ler' and len(parts) >= 3:
+                if site.should_fail():
+                    return self.fail('/ler/')
+                manga = int(parts[1].rsplit('-', 1)[-1])
+                chapter_id = site.chapter_id(manga, int(parts[2]))
+                # A página de leitura real é grande; o enchimento imita esse custo
+                filler = '<p>' + 'x' * 60000 + '</p>'
+                html = (f'<html><head><meta chapter-id="{chapter_id}"><meta token="{TOKEN}"></head>'
+                        f'<body>{filler}</body></html>')
+                return self.send_body(200, html.encode(), endpoint='/ler/')
+
+            if parts[0] == 'imagens' and len(parts) == 3:
+                if site.should_fail():
+                    return self.fail('/imagens/')
+                body = site.image(int(parts[1]), int(parts[2].split('.')[0]))
+                byte_range = self.headers.get('Range')
+                if byte_range and byte_range.startswith('bytes='):
+                    start = int(byte_range[6:].split('-')[0] or 0)
+                    if start >= len(body):
+                        return self.send_body(416, b'', headers={'Content-Range': f'bytes */{len(body)}'},
+                                              endpoint='/imagens/ (range)')
+                    headers = {'Content-Range': f'bytes {start}-{len(body) - 1}/{len(body)}'}
+                    return self.send_body(206, body[start:], 'image/jpeg', headers, '/imagens/ (range)')
+                return self.send_body(200, body, 'image/jpeg', endpoint='/imagens/')
+
+            self.send_body(404, b'', endpoint='404')
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            length = int(self.headers.get('Content-Length', 0))
+            form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+            endpoint = path.rsplit('/', 1)[-1]
+
+            if site.should_fail():
+                return self.fail(endpoint)
+            if form.get('token') != TOKEN:
+                return self.send_body(403, b'{"error": "token"}', 'application/json', endpoint=endpoint + ' (403)')
+
+            if endpoint == 'manga_info.php':
+                manga = int(form['manga_id'])
+                data = {'titulo': f'Manga {manga}', 'ultimo_capitulo': site.chapters,
+                        'autor': 'Benchmark', 'sinopse': 'Mangá sintético'}
+                # Validador para as verificações condicionais do modo watch
+                etag = f'"{manga}-{site.chapters}"'
+                if self.headers.get('If-None-Match') == etag:
+                    return self.send_body(304, b'', headers={'ETag': etag}, endpoint=endpoint + ' (304)')
+                return self.send_body(200, json.dumps(data).encode(), 'application/json',
+                                      {'ETag': etag}, endpoint)
+
+            if endpoint == 'manga_capitulos.php':
+                base_url = 'http://' + self.headers.get('Host', '')
+                html = site.chapter_list(base_url, int(form['manga_id']), int(form['offset']), int(form['limit']))
+                return self.send_body(200, html.encode(), endpoint=endpoint)
+
+            if endpoint in ('capitulos_info.php', 'capitulos_read.php'):
+                chapter_id = int(form['chapter_id'])
+                manga, number = site.split_chapter_id(chapter_id)
+                if endpoint == 'capitulos_info.php':
+                    data = {'manga': {'titulo': f'Manga {manga}'}, 'capitulo': {'numero': number}}
+                else:
+                    data = {'imageUrls': [f'../imagens/{chapter_id}/{page:03d}.jpg'
+                                          for page in range(1, site.pages + 1)]}
+                return self.send_body(200, json.dumps(data).encode(), 'application/json', endpoint=endpoint)
+
+            self.send_body(404, b'', endpoint='404')
+
+    return Handler
+
+def add_arguments(parser):
+    parser.add_argument('--mangas', type=int, default=2, help="Quantidade de mangás sintéticos")
+    parser.add_argument('--capitulos', type=int, default=20, help="Capítulos por mangá")
+    parser.add_argument('--paginas', type=int, default=20, help="Páginas por capítulo")
+    parser.add_argument('--tamanho-imagem', type=int, default=200 * 1024, help="Bytes por imagem")
+    parser.add_argument('--latencia', type=float, default=0.02, help="Latência por resposta (s)")
+    parser.add_argument('--banda', type=float, default=0, help="Banda por resposta (bytes/s, 0 = sem limite)")
+    parser.add_argument('--taxa-erros', type=float, default=0.0, help="Fração de respostas 503 (0 a 1)")
+
+def create_server(args, port=0):
+    site = MockSite(args.mangas, args.capitulos, args.paginas, args.tamanho_imagem,
+                    args.latencia, args.banda, args.taxa_erros)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(site))
+    server.daemon_threads = True
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita o sakuramangas.org")
+    parser.add_argument('--porta', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = create_server(args, args.porta)
+    print(f"Servidor de benchmark em http://127.0.0.1:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    sys.exit(main())
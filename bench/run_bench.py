@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import glob
+import socket
+import argparse
+import tempfile
+import subprocess
+import contextlib
+import urllib.request
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CODE_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'code')
+
+sys.path.insert(0, BENCH_DIR)
+import mock_server
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(args):
+    """
+    Sobe o servidor falso em outro processo, para que o RSS medido seja só
+    o do downloader
+    """
+    port = free_port()
+    command = [sys.executable, os.path.join(BENCH_DIR, 'mock_server.py'), '--porta', str(port),
+               '--mangas', str(args.mangas), '--capitulos', str(args.capitulos),
+               '--paginas', str(args.paginas), '--tamanho-imagem', str(args.tamanho_imagem),
+               '--latencia', str(args.latencia), '--banda', str(args.banda),
+               '--taxa-erros', str(args.taxa_erros)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base_url + '/__stats', timeout=1).read()
+            return process, base_url
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("Servidor de benchmark não respondeu")
+
+def server_stats(base_url):
+    with urllib.request.urlopen(base_url + '/__stats', timeout=5) as response:
+        return json.load(response)
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run(args, base_url):
+    """
+    Executa manga.py e cap.py contra o servidor falso e retorna as métricas
+    """
+    os.environ['SAKURA_BASE_URL'] = base_url
+    sys.path.insert(0, CODE_DIR)
+    import cap
+    import manga
+    import metacache
+    import metrics
+
+    cap.configure(args.conexoes, args.rps, args.conexoes_max, args.rps_max)
+    cap.configure_output(args.cbz, False, args.dedup)
+
+    output = sys.stdout if args.verbose else open(os.devnull, 'w')
+    with contextlib.redirect_stdout(output):
+        start = time.perf_counter()
+        json_files = []
+        for index in range(1, args.mangas + 1):
+            catalog = manga.fetch_catalog(f'{base_url}/obras/manga-{index}/')
+            if catalog:
+                json_files.append(catalog['links_caps'])
+        catalog_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        succeeded, failed = cap.download_chapters(json_files, args.capitulos_simultaneos, args.adiantar)
+        download_time = time.perf_counter() - start
+        # Grava o cache agora, enquanto o diretório atual ainda é o do benchmark
+        metacache.save()
+
+    if args.cbz:
+        pages = sum(1 for _ in glob.glob(os.path.join('mangas', '*', '*.cbz'))) * args.paginas
+    else:
+        pages = len(glob.glob(os.path.join('mangas', '*', '*', 'pages', '*.jpg')))
+
+    stats = server_stats(base_url)
+    return {
+        'catalogo_s': round(catalog_time, 3),
+        'download_s': round(download_time, 3),
+        'capitulos_ok': succeeded,
+        'capitulos_falha': failed,
+        'paginas': pages,
+        'paginas_por_s': round(pages / download_time, 2) if download_time else None,
+        'capitulos_por_min': round(succeeded * 60 / download_time, 2) if download_time else None,
+        'mb_recebidos': round(stats['bytes'] / (1024 * 1024), 2),
+        'requisicoes': stats['requests'],
+        'requisicoes_total': sum(stats['requests'].values()),
+        'pico_rss_mb': round(peak_rss_mb(), 1) if resource else None,
+        'metricas': metrics.snapshot(),
+    }
+
+def print_report(results):
+    print("\n=== Benchmark Sakura Mangas Downloader ===")
+    for key, value in results.items():
+        if key in ('requisicoes', 'metricas'):
+            continue
+        print(f"{key:>20}: {value}")
+    print("\nRequisições por endpoint:")
+    for endpoint, count in sorted(results['requisicoes'].items()):
+        print(f"  {endpoint:<32} {count}")
+    print("\nTempo médio por etapa:")
+    stages = results['metricas']['histogramas'].get('sakura_stage_seconds', {})
+    for stage, histogram in sorted(stages.items()):
+        print(f"  {stage:<32} {histogram['media_s']:.4f}s x {histogram['quantidade']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline com servidor falso do sakuramangas.org")
+    mock_server.add_arguments(parser)
+    parser.add_argument('--capitulos-simultaneos', type=int, default=3)
+    parser.add_argument('--conexoes', type=int, default=4)
+    parser.add_argument('--adiantar', type=int, default=3, help="Capítulos resolvidos à frente das transferências")
+    parser.add_argument('--rps', type=float, default=1000.0, help="Limite de requisições por segundo do cliente")
+    parser.add_argument('--conexoes-max', type=int, help="Teto do controle adaptativo de conexões")
+    parser.add_argument('--rps-max', type=float, help="Teto do controle adaptativo de requisições por segundo")
+    parser.add_argument('--cbz', action='store_true')
+    parser.add_argument('--dedup', action='store_true')
+    parser.add_argument('--json', help="Grava o resultado neste arquivo JSON")
+    parser.add_argument('--verbose', action='store_true', help="Mostra a saída do downloader")
+    args = parser.parse_args()
+
+    process, base_url = start_server(args)
+    workdir = tempfile.mkdtemp(prefix='sakura-bench-')
+    previous_dir = os.getcwd()
+    try:
+        os.chdir(workdir)
+        results = run(args, base_url)
+    finally:
+        os.chdir(previous_dir)
+        process.terminate()
+        process.wait()
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+    print(f"\nArquivos do benchmark em {workdir}")
+
+if __name__ == "__main__":
+    main()
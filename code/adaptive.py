@@ -0,0 +1,167 @@
+import time
+import threading
+import email.utils
+import metrics
+import ratelimit
+
+# Respostas que indicam que o site está sobrecarregado ou limitando o cliente
+STATUS_LIMITACAO = (429, 503)
+# Fator de redução multiplicativa da taxa e da concorrência
+FATOR_REDUCAO = 0.5
+# Aumento aditivo da taxa (requisições/s) a cada janela saudável
+PASSO_TAXA = 0.5
+# Latência máxima (s) para uma resposta contar como saudável
+LATENCIA_SAUDAVEL = 2.0
+# Intervalo mínimo (s) entre duas reduções, para uma rajada de erros não derrubar tudo
+INTERVALO_REDUCAO = 1.0
+# Pausa máxima aceita de um Retry-After (s)
+PAUSA_MAXIMA = 300.0
+# Teto padrão de crescimento, em múltiplos dos valores iniciais
+FATOR_TETO = 3
+
+class AdjustableSemaphore:
+    """
+    Semáforo cujo limite pode ser alterado enquanto está em uso, sem nunca
+    passar do teto informado na criação
+    """
+    def __init__(self, limit, ceiling=None):
+        self.ceiling = ceiling
+        self.limit = self._bounded(limit)
+        self.in_use = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_use >= self.limit:
+                self.condition.wait()
+            self.in_use += 1
+
+    def release(self):
+        with self.condition:
+            self.in_use -= 1
+            self.condition.notify()
+
+    def _bounded(self, limit):
+        if self.ceiling is not None:
+            limit = min(limit, self.ceiling)
+        return max(1, int(limit))
+
+    def set_limit(self, limit):
+        with self.condition:
+            self.limit = self._bounded(limit)
+            self.condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def parse_retry_after(value):
+    """
+    Converte o cabeçalho Retry-After (segundos ou data HTTP) em segundos
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        moment = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, moment.timestamp() - time.time())
+
+class AdaptiveController:
+    """
+    Controle AIMD da taxa de requisições e das conexões simultâneas: cresce
+    aos poucos enquanto as respostas são rápidas e bem-sucedidas e cai pela
+    metade em 429, 503 ou timeout, respeitando o Retry-After
+    """
+    def __init__(self, rate, connections, max_rate=None, max_connections=None):
+        self.lock = threading.Lock()
+        self.rate = float(rate)
+        self.connections = int(connections)
+        self.min_rate = min(0.5, self.rate)
+        self.max_rate = float(max_rate if max_rate is not None else rate * FATOR_TETO)
+        self.max_connections = int(max_connections if max_connections is not None
+                                   else connections * FATOR_TETO)
+        self.healthy = 0
+        self.last_decrease = 0.0
+        self.blocked_until = 0.0
+        self.semaphores = []
+
+    def semaphore(self, ceiling=None):
+        """
+        Cria um semáforo de conexões que acompanha os ajustes do controle
+        """
+        semaphore = AdjustableSemaphore(self.connections, ceiling)
+        with self.lock:
+            self.semaphores.append(semaphore)
+        return semaphore
+
+    def _apply(self):
+        ratelimit.configure(self.rate, max(1.0, self.rate))
+        for semaphore in self.semaphores:
+            semaphore.set_limit(self.connections)
+        metrics.inc('sakura_adaptive_adjustments_total')
+
+    def wait_if_blocked(self):
+        """
+        Aguarda o fim de uma pausa pedida pelo servidor (Retry-After)
+        """
+        delay = self.blocked_until - time.monotonic()
+        if delay > 0:
+            metrics.inc('sakura_sleep_seconds_total', delay, motivo='retry_after')
+            time.sleep(delay)
+
+    def on_success(self, latency):
+        with self.lock:
+            if latency > LATENCIA_SAUDAVEL:
+                self.healthy = 0
+                return
+            self.healthy += 1
+            # Uma janela saudável equivale a uma rodada completa de conexões
+            if self.healthy < max(self.connections, 1) * 2:
+                return
+            self.healthy = 0
+            if self.rate >= self.max_rate and self.connections >= self.max_connections:
+                return
+            self.rate = min(self.max_rate, self.rate + PASSO_TAXA)
+            self.connections = min(self.max_connections, self.connections + 1)
+            self._apply()
+
+    def on_throttle(self, retry_after=None):
+        """
+        Reduz taxa e concorrência e, se pedido, pausa todas as requisições
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.healthy = 0
+            pause = min(PAUSA_MAXIMA, retry_after if retry_after is not None else 0.0)
+            if pause:
+                self.blocked_until = max(self.blocked_until, now + pause)
+            if now - self.last_decrease < INTERVALO_REDUCAO:
+                return pause
+            self.last_decrease = now
+            self.rate = max(self.min_rate, self.rate * FATOR_REDUCAO)
+            self.connections = max(1, int(self.connections * FATOR_REDUCAO))
+            self._apply()
+            print(f"Servidor limitando: reduzindo para {self.rate:.1f} req/s e {self.connections} conexão(ões)")
+        metrics.inc('sakura_throttled_total')
+        return pause
+
+_controller = AdaptiveController(ratelimit.REQUISICOES_POR_SEGUNDO, 4)
+
+def get_controller():
+    return _controller
+
+def configure(rate, connections, max_rate=None, max_connections=None):
+    """
+    Recria o controle com os valores iniciais e os tetos de crescimento
+    """
+    global _controller
+    _controller = AdaptiveController(rate, connections, max_rate, max_connections)
+    ratelimit.configure(rate, max(1.0, rate))
+    return _controller
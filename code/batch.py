@@ -0,0 +1,105 @@
+import sys
+import argparse
+import cap
+import manga
+import metrics
+import scheduler
+
+# Quantidade de links de capítulos acumulados antes de iniciar os downloads
+LOTE_CAPITULOS = 50
+
+def iter_urls(stream):
+    """
+    Lê URLs de um arquivo aberto, uma por linha, sem carregar tudo em memória.
+    Linhas vazias e comentários (#) são ignorados; vírgulas também separam URLs
+    """
+    for line in stream:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        for url in line.split(','):
+            url = url.strip()
+            if url:
+                yield url
+
+def is_manga_url(url):
+    """
+    Indica se a URL é de uma obra (e não de um capítulo)
+    """
+    return '/obras/' in url
+
+def run_batch(urls, incremental=False, catalog_only=False, max_chapters=scheduler.CAPITULOS_SIMULTANEOS):
+    """
+    Processa URLs de obras e de capítulos no mesmo processo, compartilhando
+    sessão HTTP, limitadores e fila de capítulos. Retorna (sucessos, falhas)
+    """
+    succeeded = 0
+    failed = 0
+    pending = []
+
+    def flush():
+        nonlocal succeeded, failed
+        if pending:
+            ok, ko = cap.download_chapters(pending, max_chapters)
+            succeeded += ok
+            failed += ko
+            pending.clear()
+
+    for url in urls:
+        if not url.startswith('http'):
+            print(f"Pulando URL inválida: {url}")
+            continue
+
+        if not is_manga_url(url):
+            pending.append(url)
+            if len(pending) >= LOTE_CAPITULOS:
+                flush()
+            continue
+
+        flush()
+        print(f"\nProcessando URL: {url}")
+        catalog = manga.fetch_catalog(url, incremental)
+        if not catalog:
+            failed += 1
+            continue
+        if catalog_only:
+            continue
+
+        jobs = scheduler.jobs_from_chapters(catalog['new_chapters'], catalog['manga_dir'], catalog['links_caps'])
+        print(f"{len(jobs)} capítulo(s) de {catalog['titulo']} na fila")
+        ok, ko = cap.download_chapters(jobs, max_chapters)
+        succeeded += ok
+        failed += ko
+
+    flush()
+    return succeeded, failed
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Sakura Mangas Downloader - modo em lote (não interativo)")
+    parser.add_argument('arquivo', nargs='?', default='-',
+                        help="Arquivo com uma URL por linha (obras ou capítulos); '-' lê da entrada padrão")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Busca só os capítulos novos das obras já conhecidas")
+    parser.add_argument('--catalogo-apenas', action='store_true',
+                        help="Atualiza manga_info.json e links_caps.json sem baixar capítulos")
+    cap.add_download_arguments(parser)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args(sys.argv[1:])
+    cap.configure_download(args)
+
+    try:
+        if args.arquivo == '-':
+            succeeded, failed = run_batch(iter_urls(sys.stdin), args.incremental, args.catalogo_apenas, args.capitulos)
+        else:
+            with open(args.arquivo, 'r', encoding='utf-8') as f:
+                succeeded, failed = run_batch(iter_urls(f), args.incremental, args.catalogo_apenas, args.capitulos)
+    finally:
+        metrics.finish(args)
+
+    print(f"\nLote concluído: {succeeded} capítulo(s) baixado(s), {failed} falha(s)")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,109 @@
 import os
 import json
 import re
-import requests
-import time
+import hashlib
+import tempfile
+import argparse
+import adaptive
+import cbz
+import client
+import httpcache
+import imaging
+import library
+import manifest
+import metacache
+import metrics
+import ratelimit
+import scheduler
+import store
 import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlparse
 
+# Número inicial de downloads simultâneos por host
+MAX_CONEXOES_POR_HOST = 4
+# Teto até onde o controle adaptativo pode aumentar as conexões por host
+MAX_CONEXOES_TETO = MAX_CONEXOES_POR_HOST * adaptive.FATOR_TETO
+# Rodadas extras para as páginas que falharam, depois que o ritmo se ajustou
+RODADAS_REPETICAO = 2
+# Recodificação opcional das páginas (imaging.PostProcessor), None desativa
+PROCESSADOR = None
+# Tamanho de cada bloco lido da rede ao gravar imagens
+TAMANHO_BLOCO = 64 * 1024
+# Gera um CBZ por capítulo (mangas/<título>/<número>.cbz)
+GERAR_CBZ = False
+# No modo CBZ, também mantém as páginas soltas em pages/
+MANTER_PAGINAS = False
+# Deduplica páginas idênticas com hardlinks para mangas/.store/
+USAR_STORE = False
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+def configure(max_connections=MAX_CONEXOES_POR_HOST, rate=ratelimit.REQUISICOES_POR_SEGUNDO,
+              max_connections_ceiling=None, max_rate=None):
+    """
+    Ajusta o limite de conexões por host e o limite global de requisições.
+    Os valores são o ponto de partida do controle adaptativo, que pode subir
+    até os tetos informados (por padrão, adaptive.FATOR_TETO vezes o valor
+    inicial) e cai quando o servidor começa a limitar
+    """
+    global MAX_CONEXOES_POR_HOST, MAX_CONEXOES_TETO
+    MAX_CONEXOES_POR_HOST = max(1, max_connections)
+    MAX_CONEXOES_TETO = max(MAX_CONEXOES_POR_HOST,
+                            max_connections_ceiling or MAX_CONEXOES_POR_HOST * adaptive.FATOR_TETO)
+    max_rate = max(rate, max_rate or rate * adaptive.FATOR_TETO)
+    with _host_semaphores_lock:
+        _host_semaphores.clear()
+    adaptive.configure(rate, MAX_CONEXOES_POR_HOST, max_rate, MAX_CONEXOES_TETO)
+    if client.TAMANHO_POOL < MAX_CONEXOES_TETO:
+        client.configure(pool_size=MAX_CONEXOES_TETO)
+
+def configure_output(generate_cbz=False, keep_pages=False, dedup=False):
+    """
+    Escolhe o formato de saída: páginas soltas (padrão) ou CBZ por capítulo,
+    e se as páginas são deduplicadas no armazenamento por conteúdo
+    """
+    global GERAR_CBZ, MANTER_PAGINAS, USAR_STORE
+    GERAR_CBZ = generate_cbz
+    MANTER_PAGINAS = keep_pages
+    USAR_STORE = dedup
+
+def configure_processing(image_format=None, quality=imaging.QUALIDADE_PADRAO, max_height=None, workers=None):
+    """
+    Ativa a recodificação das páginas em WebP ou JPEG (com qualidade
+    limitada e altura máxima opcional). Sem formato nem altura, desativa.
+    Retorna False se o Pillow não estiver instalado
+    """
+    global PROCESSADOR
+    if PROCESSADOR is not None:
+        PROCESSADOR.shutdown()
+        PROCESSADOR = None
+    if not image_format and not max_height:
+        return True
+    if not imaging.available():
+        print("Pillow não está instalado (pip install Pillow); as páginas não serão recodificadas")
+        return False
+    PROCESSADOR = imaging.PostProcessor(image_format or 'jpeg', quality, max_height, workers)
+    return True
+
+def chapter_is_complete(chapter_folder):
+    """
+    Indica, sem acessar a rede, se o capítulo já está completo no formato atual
+    """
+    if GERAR_CBZ:
+        return os.path.exists(cbz.cbz_path(chapter_folder))
+    return manifest.is_complete(chapter_folder)
+
+@metrics.timed('sakura_stage_seconds', etapa='meta_capitulo')
 def extract_meta_from_url(url):
     """
     Extrai chapter_id e token da URL ou conteúdo HTML
     """
     try:
         # Tenta buscar o conteúdo da página primeiro
-        response = requests.get(url)
+        response = client.get(url)
         if response.status_code != 200:
             print(f"Falha ao acessar URL: {url}")
             return None, None
@@ -34,112 +126,485 @@ def extract_meta_from_url(url):
         print(f"Erro ao acessar URL: {e}")
         return None, None
 
+@metrics.timed('sakura_stage_seconds', etapa='capitulo_info')
 def get_chapter_info(chapter_id, token):
     """
     Obtém informações do capítulo usando a API
     """
-    url = 'https://sakuramangas.org/dist/sakura/models/capitulo/capitulos_info.php'
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        'X-Requested-With': 'XMLHttpRequest'
-    }
+    url = client.BASE_URL + '/dist/sakura/models/capitulo/capitulos_info.php'
+    headers = client.API_HEADERS
     data = f'chapter_id={chapter_id}&token={token}'
     
     try:
-        response = requests.post(url, headers=headers, data=data)
+        response = client.post(url, headers=headers, data=data)
         if response.status_code != 200:
             print(f"Falha ao obter informações do capítulo: Código de status {response.status_code}")
             return None
             
-        return response.json()
+        chapter_info = response.json()
     except Exception as e:
         print(f"Erro ao obter informações do capítulo: {e}")
-        return None
+        chapter_info = None
+    if not _valid_chapter_info(chapter_info):
+        # Um 200 sem os dados do capítulo (token recusado) não pode ficar no
+        # cache HTTP, senão a nova tentativa com o token novo receberia o mesmo
+        httpcache.invalidate('POST', url, {'data': data})
+    return chapter_info
 
+@metrics.timed('sakura_stage_seconds', etapa='capitulo_paginas')
 def get_chapter_pages(chapter_id, token):
     """
     Obtém páginas do capítulo usando a API
     """
-    url = 'https://sakuramangas.org/dist/sakura/models/capitulo/capitulos_read.php'
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        'X-Requested-With': 'XMLHttpRequest'
-    }
+    url = client.BASE_URL + '/dist/sakura/models/capitulo/capitulos_read.php'
+    headers = client.API_HEADERS
     data = f'chapter_id={chapter_id}&token={token}'
     
     try:
-        response = requests.post(url, headers=headers, data=data)
+        response = client.post(url, headers=headers, data=data)
         if response.status_code != 200:
             print(f"Falha ao obter páginas do capítulo: Código de status {response.status_code}")
             return None
             
-        return response.json()
+        chapter_pages = response.json()
     except Exception as e:
         print(f"Erro ao obter páginas do capítulo: {e}")
+        chapter_pages = None
+    if not _valid_chapter_pages(chapter_pages):
+        # Mesmo caso de get_chapter_info
+        httpcache.invalidate('POST', url, {'data': data})
+    return chapter_pages
+
+def _get_host_semaphore(host, limit):
+    """
+    Retorna o semáforo que limita as conexões simultâneas para um host. O
+    limite acompanha o controle adaptativo, sem passar de limit
+    """
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = adaptive.get_controller().semaphore(limit)
+        return _host_semaphores[host]
+
+def _expected_size(response):
+    """
+    Calcula o tamanho final esperado do arquivo a partir dos cabeçalhos
+    """
+    if response.headers.get('Content-Encoding'):
+        # Com compressão o Content-Length não corresponde aos bytes gravados
         return None
+    if response.status_code == 206:
+        content_range = response.headers.get('Content-Range', '')
+        total = content_range.rsplit('/', 1)[-1]
+        return int(total) if total.isdigit() else None
+    content_length = response.headers.get('Content-Length')
+    return int(content_length) if content_length and content_length.isdigit() else None
 
-def download_images(image_urls, output_folder):
+def _content_range(response):
     """
-    Faz download das imagens das URLs e salva na pasta especificada
+    (início, total) do cabeçalho Content-Range ('bytes 100-199/200' ou
+    'bytes */200'); None no que não vier informado
+    """
+    value = response.headers.get('Content-Range', '')
+    match = re.match(r'bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)', value)
+    if not match:
+        return None, None
+    start, total = match.groups()
+    return (int(start) if start else None), (int(total) if total.isdigit() else None)
+
+def _copy_stream(response, f):
     """
+    Copia o corpo da resposta para f em blocos de tamanho fixo, respeitando
+    o limite global de bytes em memória e o de bytes por segundo. Retorna
+    (bytes, sha256)
+    """
+    budget = ratelimit.get_memory_budget()
+    sha = hashlib.sha256()
+    written = 0
+    chunks = response.iter_content(chunk_size=TAMANHO_BLOCO)
+    while True:
+        with budget.reserve(TAMANHO_BLOCO):
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            f.write(chunk)
+            sha.update(chunk)
+            written += len(chunk)
+        # A espera fica fora da reserva: o bloco já saiu da memória e a
+        # leitura parada segura o servidor pelo controle de fluxo do TCP
+        waited = ratelimit.consume_bandwidth(len(chunk))
+        if waited:
+            metrics.inc('sakura_sleep_seconds_total', waited, motivo='limite_banda')
+    metrics.inc('sakura_bytes_total', written, tipo='imagem')
+    return written, sha.hexdigest()
+
+def _stream_to_file(response, part_path, mode):
+    """
+    Grava o corpo da resposta no arquivo .part e força a gravação em disco
+    """
+    with open(part_path, mode) as f:
+        _copy_stream(response, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+@metrics.timed('sakura_stage_seconds', etapa='imagem')
+def download_image(full_url, output_path, per_host_limit=None):
+    """
+    Faz download de uma única imagem respeitando o limite de conexões por host.
+    A imagem é transmitida em blocos para um arquivo .part, retomado com HTTP
+    Range quando já existe, e só é renomeada para o nome final depois de
+    conferido o Content-Length.
+    """
+    if per_host_limit is None:
+        per_host_limit = MAX_CONEXOES_TETO
+    filename = os.path.basename(output_path)
+    host = urlparse(full_url).netloc
+    part_path = output_path + '.part'
+    
+    with _get_host_semaphore(host, per_host_limit):
+        print(f"Fazendo download de {filename} de {full_url}")
+        try:
+            # Um .part que não confere com o Content-Range é descartado e a
+            # página é baixada de novo do zero, na segunda volta
+            for _ in range(2):
+                headers = {}
+                resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                if resume_from:
+                    headers['Range'] = f'bytes={resume_from}-'
+                
+                with client.get(full_url, headers=headers, stream=True) as response:
+                    if response.status_code == 206 and resume_from:
+                        start, _ = _content_range(response)
+                        if start != resume_from:
+                            print(f"Servidor retomou {filename} do byte {start}, não de {resume_from}; recomeçando")
+                            os.remove(part_path)
+                            continue
+                        mode = 'ab'
+                        print(f"Retomando {filename} a partir de {resume_from} bytes")
+                    elif response.status_code == 200:
+                        # Servidor ignorou o Range: recomeça do zero
+                        mode = 'wb'
+                    elif response.status_code == 416 and resume_from:
+                        _, total = _content_range(response)
+                        if total != resume_from:
+                            print(f"{filename}.part com {resume_from} bytes não confere com o tamanho {total}; recomeçando")
+                            os.remove(part_path)
+                            continue
+                        # O .part já contém o arquivo inteiro
+                        os.replace(part_path, output_path)
+                        print(f"Download concluído: {filename}")
+                        return True
+                    else:
+                        print(f"Falha ao baixar {filename}: Código de status {response.status_code}")
+                        return False
+                    
+                    expected_size = _expected_size(response)
+                    _stream_to_file(response, part_path, mode)
+                
+                written = os.path.getsize(part_path)
+                if expected_size is not None and written != expected_size:
+                    # Mantém o .part para retomar na próxima tentativa
+                    print(f"Download incompleto de {filename}: {written} de {expected_size} bytes")
+                    return False
+                
+                os.replace(part_path, output_path)
+                print(f"Download concluído: {filename}")
+                return True
+            return False
+            
+        except Exception as e:
+            print(f"Erro ao baixar {filename}: {e}")
+            return False
+
+@metrics.timed('sakura_stage_seconds', etapa='imagem')
+def download_image_to_archive(full_url, filename, archive, per_host_limit=None):
+    """
+    Faz download de uma imagem direto para o CBZ do capítulo, sem gravar a
+    página solta na pasta. Retorna (ok, tamanho, sha256)
+    """
+    if per_host_limit is None:
+        per_host_limit = MAX_CONEXOES_TETO
+    host = urlparse(full_url).netloc
+    
+    with _get_host_semaphore(host, per_host_limit):
+        print(f"Fazendo download de {filename} de {full_url}")
+        try:
+            with client.get(full_url, stream=True) as response:
+                if response.status_code != 200:
+                    print(f"Falha ao baixar {filename}: Código de status {response.status_code}")
+                    return False, None, None
+                
+                expected_size = _expected_size(response)
+                # A página vai para um temporário anônimo no disco até ser
+                # copiada para o CBZ; em memória só fica o bloco em trânsito,
+                # que já conta no limite de --memoria
+                with tempfile.TemporaryFile() as buffer:
+                    size, sha256 = _copy_stream(response, buffer)
+                    if expected_size is not None and size != expected_size:
+                        print(f"Download incompleto de {filename}: {size} de {expected_size} bytes")
+                        return False, None, None
+                    buffer.seek(0)
+                    archive.add_page(filename, buffer)
+            
+            print(f"Download concluído: {filename}")
+            return True, size, sha256
+            
+        except Exception as e:
+            print(f"Erro ao baixar {filename}: {e}")
+            return False, None, None
+
+def _place_known_page(full_url, output_path, entry):
+    """
+    Procura o hash da página no manifesto ou no índice (pela URL) e, se o blob
+    existir no armazenamento, cria a página sem baixá-la
+    """
+    sha256 = entry.get('sha256') if entry else None
+    if not store.has_blob(sha256):
+        try:
+            sha256 = library.page_hash_for_url(full_url)
+        except Exception:
+            sha256 = None
+    if not store.has_blob(sha256):
+        return None
+    
+    store.place(sha256, output_path)
+    print(f"Página {os.path.basename(output_path)} já conhecida, ligada ao armazenamento")
+    return {'url': full_url, 'size': os.path.getsize(output_path), 'sha256': sha256}
+
+def _discard_page(output_path):
+    """
+    Remove a página e o seu .part, se existirem
+    """
+    for path in (output_path, output_path + '.part'):
+        if os.path.exists(path):
+            os.remove(path)
+
+def _page_entry(full_url, filename, size, sha256, path=None):
+    """
+    Entrada do manifesto para uma página; 'arquivo' só aparece quando o nome
+    no disco difere do nome original (página recodificada)
+    """
+    entry = {'url': full_url, 'size': size, 'sha256': sha256}
+    if path and os.path.basename(path) != filename:
+        entry['arquivo'] = os.path.basename(path)
+    return entry
+
+def _resolved(result):
+    """
+    Resultado de fetch: bool ou Future da recodificação ainda em andamento
+    """
+    return result.result() if isinstance(result, Future) else result
+
+def image_url(img_url):
+    """
+    URL completa de uma imagem de imageUrls
+    """
+    # Limpa a URL removendo '../' e garantindo que comece com '/'
+    clean_url = img_url.replace('../', '')
+    if not clean_url.startswith('/'):
+        clean_url = '/' + clean_url
+    return client.BASE_URL + clean_url
+
+def download_images(image_urls, output_folder, max_workers=None, archive=None, keep_pages=True):
+    """
+    Faz download das imagens das URLs em paralelo e salva na pasta especificada.
+    Páginas já registradas no manifesto do capítulo com o tamanho correto
+    não são baixadas novamente e as que falharem voltam para a fila por
+    algumas rodadas. Com um CbzWriter em archive, cada página
+    entra no CBZ assim que chega; com keep_pages=False nenhuma página solta
+    é gravada em pages/. Com um PostProcessor configurado, cada página é
+    recodificada em outro processo enquanto as próximas são baixadas.
+    """
+    if max_workers is None:
+        max_workers = MAX_CONEXOES_TETO
+    if archive is None:
+        keep_pages = True
+    processor = PROCESSADOR
+    # Sem keep_pages, a página só passa pelo disco para ser recodificada
+    to_disk = keep_pages or processor is not None
     pages_folder = os.path.join(output_folder, 'pages')
-    if not os.path.exists(pages_folder):
+    if to_disk and not os.path.exists(pages_folder):
         os.makedirs(pages_folder)
     
-    base_url = 'https://sakuramangas.org'
+    if archive is not None:
+        archive.set_order([os.path.basename(img_url) for img_url in image_urls])
+    chapter_manifest = manifest.load(output_folder)
+    manifest_lock = threading.Lock()
     
+    tasks = []
+    expected = []
     for img_url in image_urls:
-        # Limpa a URL removendo '../' e garantindo que comece com '/'
-        clean_url = img_url.replace('../', '')
-        if not clean_url.startswith('/'):
-            clean_url = '/' + clean_url
-            
-        full_url = base_url + clean_url
+        full_url = image_url(img_url)
         
         # Extrai o nome do arquivo (ex: '001.jpg')
         filename = os.path.basename(img_url)
-        output_path = os.path.join(pages_folder, filename)
+        final_name = processor.output_filename(filename) if processor else filename
+        output_path = os.path.join(pages_folder, final_name)
+        expected.append(filename)
         
-        print(f"Fazendo download de {filename} de {full_url}")
-        try:
-            response = requests.get(full_url)
-            if response.status_code == 200:
-                with open(output_path, 'wb') as f:
-                    f.write(response.content)
-                print(f"Download concluído: {filename}")
-            else:
-                print(f"Falha ao baixar {filename}: Código de status {response.status_code}")
-                
-            # Adiciona um pequeno atraso para evitar sobrecarregar o servidor
-            time.sleep(0.5)
-            
-        except Exception as e:
-            print(f"Erro ao baixar {filename}: {e}")
+        if keep_pages:
+            entry = chapter_manifest['pages'].get(filename)
+            if entry and entry.get('url') and entry['url'] != full_url:
+                # Página de outro upload (outra scan) do mesmo capítulo
+                _discard_page(manifest.page_path(pages_folder, filename, entry))
+                del chapter_manifest['pages'][filename]
+                entry = None
+            elif entry is None and manifest.looks_complete(output_path):
+                # Página baixada antes da existência do manifesto
+                size, sha256 = manifest.file_digest(output_path)
+                entry = _page_entry(full_url, filename, size, sha256, output_path)
+                chapter_manifest['pages'][filename] = entry
+            page_path = manifest.page_path(pages_folder, filename, entry)
+            if not manifest.page_is_valid(page_path, entry) and USAR_STORE:
+                # Conteúdo já conhecido: a página vira um link para o blob
+                entry = _place_known_page(full_url, output_path, entry)
+                if entry:
+                    entry = _page_entry(full_url, filename, entry['size'], entry['sha256'], output_path)
+                    chapter_manifest['pages'][filename] = entry
+                    page_path = output_path
+            if manifest.page_is_valid(page_path, entry):
+                if archive is not None:
+                    archive.add_file(os.path.basename(page_path), page_path)
+                continue
+        tasks.append((full_url, filename))
+    
+    chapter_manifest['expected'] = expected
+    chapter_manifest['complete'] = False
+    manifest.save(output_folder, chapter_manifest)
+    
+    skipped = len(expected) - len(tasks)
+    if skipped:
+        print(f"{skipped} página(s) já baixada(s), {len(tasks)} restante(s)")
+    
+    def record(filename, ok, entry=None):
+        if ok:
+            with manifest_lock:
+                chapter_manifest['pages'][filename] = entry
+                manifest.save(output_folder, chapter_manifest)
+        metrics.inc('sakura_pages_total', resultado='ok' if ok else 'falha')
+        return ok
+    
+    def finish(full_url, filename, path):
+        size, sha256 = manifest.file_digest(path)
+        if USAR_STORE and keep_pages:
+            store.ingest(path, sha256)
+        if archive is not None:
+            archive.add_file(os.path.basename(path), path)
+        if not keep_pages:
+            os.remove(path)
+        return record(filename, True, _page_entry(full_url, filename, size, sha256, path))
+    
+    def fetch(full_url, filename):
+        if not to_disk:
+            ok, size, sha256 = download_image_to_archive(full_url, filename, archive, max_workers)
+            return record(filename, ok, _page_entry(full_url, filename, size, sha256))
+        
+        raw_path = os.path.join(pages_folder, filename)
+        if not download_image(full_url, raw_path, max_workers):
+            return record(filename, False)
+        if processor is None:
+            return finish(full_url, filename, raw_path)
+        # Espera uma vaga na fila de recodificação e volta para a rede
+        output_path = os.path.join(pages_folder, processor.output_filename(filename))
+        return processor.submit(raw_path, output_path,
+                                lambda path: finish(full_url, filename, path))
+    
+    # As páginas são submetidas em ordem e cada uma é salva com o seu próprio
+    # nome; as que falharem voltam para a fila enquanto houver rodadas
+    pending = tasks
+    for attempt in range(RODADAS_REPETICAO + 1):
+        if not pending:
+            break
+        if attempt:
+            print(f"Tentando novamente {len(pending)} página(s) que falharam")
+            metrics.inc('sakura_pages_requeued_total', len(pending))
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = [executor.submit(fetch, full_url, filename)
+                       for full_url, filename in pending]
+            results = [_resolved(future.result()) for future in futures]
+        pending = [task for task, ok in zip(pending, results) if not ok]
+    
+    if to_disk and not keep_pages and not os.listdir(pages_folder):
+        os.rmdir(pages_folder)
+    chapter_manifest['complete'] = not pending
+    manifest.save(output_folder, chapter_manifest)
+    return chapter_manifest['complete']
 
-def download_chapter(url_or_chapter_id, token=None):
+def resolve_chapter_meta(url, refresh=False):
     """
-    Faz download de um capítulo de mangá
+    Obtém chapter_id e token do cache de resolução ou, se necessário, da
+    página do capítulo. Retorna (chapter_id, token, veio_do_cache)
+    """
+    if not refresh:
+        chapter_id, token = metacache.lookup(url)
+        if chapter_id and token:
+            return chapter_id, token, True
+    
+    print(f"Extraindo metadados da URL: {url}")
+    chapter_id, token = extract_meta_from_url(url)
+    if chapter_id and token:
+        metacache.store(url, chapter_id, token)
+    return chapter_id, token, False
+
+def _refresh_chapter_meta(url):
+    """
+    Descarta o token em cache recusado pela API e busca a página novamente
+    """
+    print("Token em cache recusado, buscando a página do capítulo novamente")
+    metacache.invalidate(url)
+    chapter_id, token, _ = resolve_chapter_meta(url, refresh=True)
+    return chapter_id, token
+
+def _index_chapter(link, status, **kwargs):
     """
-    # Se uma URL for fornecida, extrai chapter_id e token
+    Atualiza o capítulo no índice da biblioteca sem interromper o download
+    """
+    if not link:
+        return
+    try:
+        library.record_chapter(link, status, **kwargs)
+    except Exception as e:
+        print(f"Erro ao atualizar o índice da biblioteca: {e}")
+
+def _valid_chapter_info(chapter_info):
+    return bool(chapter_info) and 'manga' in chapter_info and 'capitulo' in chapter_info
+
+def _valid_chapter_pages(chapter_pages):
+    return bool(chapter_pages) and 'imageUrls' in chapter_pages
+
+def resolve_chapter(url_or_chapter_id, token=None):
+    """
+    Primeira etapa do download de um capítulo: obtém chapter_id e token,
+    capitulos_info.php e capitulos_read.php e prepara a pasta. Retorna os
+    dados para transfer_chapter, True se o capítulo já estiver completo ou
+    None em caso de falha
+    """
+    # Se uma URL for fornecida, obtém chapter_id e token do cache ou da página
+    chapter_url = None
+    cached = False
     if url_or_chapter_id.startswith('http'):
-        print(f"Extraindo metadados da URL: {url_or_chapter_id}")
-        chapter_id, token = extract_meta_from_url(url_or_chapter_id)
+        chapter_url = url_or_chapter_id
+        chapter_id, token, cached = resolve_chapter_meta(chapter_url)
         if not chapter_id or not token:
             print("Falha ao extrair chapter_id e token da URL")
-            return False
+            return None
     else:
         chapter_id = url_or_chapter_id
         if not token:
             print("Token é necessário quando fornecido chapter_id diretamente")
-            return False
+            return None
     
     print(f"Usando chapter_id: {chapter_id}, token: {token}")
     
     # Obtém informações do capítulo
     chapter_info = get_chapter_info(chapter_id, token)
-    if not chapter_info:
+    if not _valid_chapter_info(chapter_info) and cached:
+        chapter_id, token = _refresh_chapter_meta(chapter_url)
+        cached = False
+        chapter_info = get_chapter_info(chapter_id, token) if chapter_id else None
+    if not _valid_chapter_info(chapter_info):
         print("Falha ao obter informações do capítulo")
-        return False
+        _index_chapter(chapter_url, library.STATUS_FALHOU)
+        return None
     
     # Obtém título do mangá e número do capítulo
     manga_title = chapter_info['manga']['titulo']
@@ -151,15 +616,21 @@ def download_chapter(url_or_chapter_id, token=None):
     # Cria estrutura de pastas
     mangas_folder = 'mangas'
     if not os.path.exists(mangas_folder):
-        os.makedirs(mangas_folder)
+        os.makedirs(mangas_folder, exist_ok=True)
     
     manga_folder = os.path.join(mangas_folder, manga_title)
     if not os.path.exists(manga_folder):
-        os.makedirs(manga_folder)
+        os.makedirs(manga_folder, exist_ok=True)
     
     chapter_folder = os.path.join(manga_folder, str(chapter_number))
     if not os.path.exists(chapter_folder):
-        os.makedirs(chapter_folder)
+        os.makedirs(chapter_folder, exist_ok=True)
+    
+    if chapter_is_complete(chapter_folder):
+        print(f"Capítulo {chapter_number} de {manga_title} já está completo, pulando")
+        _index_chapter(chapter_url, library.STATUS_COMPLETO, chapter_id=chapter_id,
+                       chapter_folder=chapter_folder, numero=chapter_number)
+        return True
     
     # Salva informações do capítulo
     with open(os.path.join(chapter_folder, 'capitulo_info.json'), 'w', encoding='utf-8') as f:
@@ -167,49 +638,388 @@ def download_chapter(url_or_chapter_id, token=None):
     
     # Obtém páginas do capítulo
     chapter_pages = get_chapter_pages(chapter_id, token)
-    if not chapter_pages:
+    if not _valid_chapter_pages(chapter_pages) and cached:
+        chapter_id, token = _refresh_chapter_meta(chapter_url)
+        chapter_pages = get_chapter_pages(chapter_id, token) if chapter_id else None
+    if not _valid_chapter_pages(chapter_pages):
         print("Falha ao obter páginas do capítulo")
-        return False
+        _index_chapter(chapter_url, library.STATUS_FALHOU, chapter_id=chapter_id,
+                       chapter_folder=chapter_folder, numero=chapter_number)
+        return None
     
     # Salva informações das páginas do capítulo
     with open(os.path.join(chapter_folder, 'capitulo_pages.json'), 'w', encoding='utf-8') as f:
         json.dump(chapter_pages, f, ensure_ascii=False, indent=4)
     
+    return {
+        'link': chapter_url,
+        'chapter_id': chapter_id,
+        'manga_title': manga_title,
+        'chapter_number': chapter_number,
+        'chapter_folder': chapter_folder,
+        'image_urls': chapter_pages['imageUrls']
+    }
+
+def transfer_chapter(resolved):
+    """
+    Segunda etapa do download de um capítulo: baixa as imagens resolvidas
+    por resolve_chapter e atualiza o índice
+    """
+    chapter_folder = resolved['chapter_folder']
+    chapter_number = resolved['chapter_number']
+    manga_title = resolved['manga_title']
+    
     # Faz download das imagens
-    print(f"Fazendo download de {len(chapter_pages['imageUrls'])} imagens...")
-    download_images(chapter_pages['imageUrls'], chapter_folder)
+    print(f"Fazendo download de {len(resolved['image_urls'])} imagens...")
+    archive = cbz.CbzWriter(chapter_folder) if GERAR_CBZ else None
+    complete = False
+    try:
+        complete = download_images(resolved['image_urls'], chapter_folder, archive=archive,
+                                   keep_pages=MANTER_PAGINAS or not GERAR_CBZ)
+    finally:
+        if archive is not None:
+            archive.close(complete)
+    _index_chapter(resolved['link'], library.STATUS_COMPLETO if complete else library.STATUS_FALHOU,
+                   chapter_id=resolved['chapter_id'], chapter_folder=chapter_folder, numero=chapter_number,
+                   pages=manifest.load(chapter_folder)['pages'])
+    if not complete:
+        print(f"Capítulo {chapter_number} de {manga_title} incompleto, execute novamente para retomar")
+        return False
     
     print(f"Capítulo {chapter_number} de {manga_title} baixado com sucesso")
     return True
 
-def process_json_file(json_file_path):
+def download_chapter(url_or_chapter_id, token=None):
     """
-    Processa um arquivo JSON contendo links de capítulos
+    Faz download de um capítulo de mangá
+    """
+    resolved = resolve_chapter(url_or_chapter_id, token)
+    if resolved is None:
+        return False
+    if resolved is True:
+        return True
+    return transfer_chapter(resolved)
+
+def resolve_job(job):
+    """
+    Etapa de resolução de uma tarefa da fila, executada adiantada pelo
+    pipeline. Se o upload escolhido não resolver, tenta as versões de outras
+    scans guardadas em 'alternatives'. Retorna o mesmo que resolve_chapter,
+    com False no lugar de None
+    """
+    link = job.get('link')
+    if not link:
+        print(f"Link faltando para o capítulo {job.get('num')}")
+        return False
+    
+    # Capítulos completos são pulados sem nenhuma requisição
+    if job.get('manga_folder') and job.get('num'):
+        chapter_folder = os.path.join(job['manga_folder'], str(job['num']))
+        if chapter_is_complete(chapter_folder):
+            print(f"Capítulo {job['num']} já está completo, pulando")
+            _index_chapter(link, library.STATUS_COMPLETO)
+            return True
+    
+    if job.get('num') is not None:
+        print(f"\nResolvendo Capítulo {job['num']}: {job.get('title')} (Scan: {job.get('scan')})")
+    else:
+        print(f"\nResolvendo URL: {link}")
+    releases = [job] + [alternative for alternative in job.get('alternatives', ()) if alternative.get('link')]
+    for index, release in enumerate(releases):
+        if index:
+            print(f"\nCapítulo {job['num']} falhou com a scan {releases[index - 1].get('scan')}, "
+                  f"tentando a scan {release.get('scan')}")
+            metrics.inc('sakura_scan_fallbacks_total')
+        resolved = resolve_chapter(release['link'])
+        if resolved is True:
+            return True
+        if resolved:
+            resolved['release'] = release
+            resolved['alternatives'] = releases[index + 1:]
+            return resolved
+    return False
+
+def transfer_job(job, resolved):
+    """
+    Etapa de transferência de uma tarefa já resolvida. Se as imagens
+    falharem, as scans alternativas restantes são baixadas por inteiro
+    """
+    if job.get('num') is not None:
+        print(f"\nProcessando Capítulo {job['num']}: {job.get('title')} (Scan: {resolved['release'].get('scan')})")
+    if transfer_chapter(resolved):
+        return True
+    
+    failed_scan = resolved['release'].get('scan')
+    for alternative in resolved['alternatives']:
+        print(f"\nCapítulo {job['num']} falhou com a scan {failed_scan}, "
+              f"tentando a scan {alternative.get('scan')}")
+        metrics.inc('sakura_scan_fallbacks_total')
+        if download_chapter(alternative['link']):
+            return True
+        failed_scan = alternative.get('scan')
+    return False
+
+def process_job(job):
+    """
+    Processa uma tarefa da fila de capítulos (resolução e transferência)
+    """
+    resolved = resolve_job(job)
+    if isinstance(resolved, bool):
+        return resolved
+    return transfer_job(job, resolved)
+
+def download_chapters(items, max_chapters=scheduler.CAPITULOS_SIMULTANEOS, ahead=None):
+    """
+    Baixa capítulos a partir de links, arquivos links_caps.json ou tarefas
+    do scheduler e retorna (sucessos, falhas). Os metadados dos próximos
+    capítulos são resolvidos enquanto as imagens dos atuais são baixadas
     """
+    if ahead is None:
+        ahead = scheduler.CAPITULOS_ADIANTADOS
+    jobs = scheduler.collect_jobs(items)
+    succeeded, failed = scheduler.run_pipeline(jobs, resolve_job, transfer_job, max_chapters, ahead)
+    print(f"\n{succeeded} capítulo(s) baixado(s), {failed} falha(s)")
+    return succeeded, failed
+
+def head_image_size(full_url):
+    """
+    Tamanho de uma imagem pelo Content-Length de uma requisição HEAD, ou None
+    """
+    host = urlparse(full_url).netloc
     try:
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            chapters_data = json.load(f)
-            
-        # Processa links em ordem reversa (de baixo para cima)
-        for chapter in reversed(chapters_data):
-            link = chapter.get('link-capitulo')
-            chapter_num = chapter.get('num-capitulo')
-            chapter_title = chapter.get('cap-titulo')
-            scan_name = chapter.get('scan-nome')
-            
-            if link:
-                print(f"\nProcessando Capítulo {chapter_num}: {chapter_title} (Scan: {scan_name})")
-                download_chapter(link)
-            else:
-                print(f"Link faltando para o capítulo {chapter_num}")
-                
-            # Adiciona um pequeno atraso entre capítulos
-            time.sleep(1)
-            
+        with _get_host_semaphore(host, MAX_CONEXOES_TETO):
+            response = client.head(full_url)
+        response.close()
+    except Exception as e:
+        print(f"Erro ao consultar {os.path.basename(full_url)}: {e}")
+        return None
+    if response.status_code != 200:
+        return None
+    return _expected_size(response)
+
+def _preview_chapter(url):
+    """
+    resolve_chapter sem efeitos colaterais, para a simulação: não cria
+    pastas, não grava JSON nem atualiza o índice ou o cache de resolução.
+    Retorna o mesmo que resolve_chapter
+    """
+    chapter_id, token = metacache.lookup(url, touch=False)
+    cached = bool(chapter_id and token)
+    if not cached:
+        chapter_id, token = extract_meta_from_url(url)
+    if not chapter_id or not token:
+        print("Falha ao extrair chapter_id e token da URL")
+        return None
+    
+    chapter_info = get_chapter_info(chapter_id, token)
+    if not _valid_chapter_info(chapter_info) and cached:
+        chapter_id, token = extract_meta_from_url(url)
+        cached = False
+        chapter_info = get_chapter_info(chapter_id, token) if chapter_id else None
+    if not _valid_chapter_info(chapter_info):
+        print("Falha ao obter informações do capítulo")
+        return None
+    
+    manga_title = chapter_info['manga']['titulo']
+    chapter_number = chapter_info['capitulo']['numero']
+    chapter_folder = os.path.join('mangas', manga_title, str(chapter_number))
+    if chapter_is_complete(chapter_folder):
         return True
+    
+    chapter_pages = get_chapter_pages(chapter_id, token)
+    if not _valid_chapter_pages(chapter_pages) and cached:
+        chapter_id, token = extract_meta_from_url(url)
+        chapter_pages = get_chapter_pages(chapter_id, token) if chapter_id else None
+    if not _valid_chapter_pages(chapter_pages):
+        print("Falha ao obter páginas do capítulo")
+        return None
+    
+    return {
+        'link': url,
+        'chapter_id': chapter_id,
+        'manga_title': manga_title,
+        'chapter_number': chapter_number,
+        'chapter_folder': chapter_folder,
+        'image_urls': chapter_pages['imageUrls']
+    }
+
+def preview_job(job):
+    """
+    Etapa de resolução da simulação: como resolve_job, mas sem efeitos
+    colaterais e sem tentar as versões de outras scans
+    """
+    link = job.get('link')
+    if not link:
+        print(f"Link faltando para o capítulo {job.get('num')}")
+        return False
+    if job.get('manga_folder') and job.get('num'):
+        if chapter_is_complete(os.path.join(job['manga_folder'], str(job['num']))):
+            return True
+    return _preview_chapter(link) or False
+
+def _pending_pages(resolved):
+    """
+    URLs das páginas de um capítulo resolvido que ainda precisam ser baixadas
+    """
+    chapter_folder = resolved['chapter_folder']
+    pages_folder = os.path.join(chapter_folder, 'pages')
+    chapter_manifest = manifest.load(chapter_folder)
+    resumable = MANTER_PAGINAS or not GERAR_CBZ
+    pending = []
+    for img_url in resolved['image_urls']:
+        full_url = image_url(img_url)
+        filename = os.path.basename(img_url)
+        entry = chapter_manifest['pages'].get(filename)
+        if resumable and entry and entry.get('url') == full_url:
+            if manifest.page_is_valid(manifest.page_path(pages_folder, filename, entry), entry):
+                continue
+        pending.append(full_url)
+    return pending
+
+def _format_duration(seconds):
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m{seconds % 60:02d}s"
+
+def plan_chapters(items, max_chapters=scheduler.CAPITULOS_SIMULTANEOS):
+    """
+    Simulação: resolve os imageUrls dos capítulos pedidos, mede as páginas
+    que faltam com requisições HEAD em paralelo e mostra páginas, bytes e o
+    tempo estimado, sem baixar nenhuma imagem nem alterar as pastas e o
+    índice. Retorna um resumo em dicionário
+    """
+    jobs = scheduler.collect_jobs(items)
+    chapters = []
+    complete = 0
+    failed = 0
+    for resolved in scheduler.prefetch(jobs, preview_job, max_chapters):
+        if resolved is True:
+            complete += 1
+        elif not resolved:
+            failed += 1
+        else:
+            chapters.append((resolved, _pending_pages(resolved)))
+
+    urls = [full_url for _, pending in chapters for full_url in pending]
+    print(f"\nConsultando o tamanho de {len(urls)} página(s)...")
+    with ThreadPoolExecutor(max_workers=max(1, MAX_CONEXOES_TETO)) as executor:
+        sizes = dict(zip(urls, executor.map(head_image_size, urls)))
+
+    known = [size for size in sizes.values() if size is not None]
+    # Páginas sem Content-Length entram na estimativa pelo tamanho médio
+    average = sum(known) / len(known) if known else 0
+    total_bytes = 0
+    print()
+    for resolved, pending in chapters:
+        chapter_bytes = sum(sizes[full_url] or average for full_url in pending)
+        total_bytes += chapter_bytes
+        print(f"{resolved['manga_title']} - Capítulo {resolved['chapter_number']}: "
+              f"{len(pending)} página(s), {chapter_bytes / (1024 * 1024):.1f} MB")
+
+    rate = ratelimit.get_limiter().rate
+    estimate = len(urls) / rate if rate > 0 else 0
+    if ratelimit.BYTES_POR_SEGUNDO:
+        estimate = max(estimate, total_bytes / ratelimit.BYTES_POR_SEGUNDO)
+    print(f"\n{len(chapters)} capítulo(s) a baixar ({complete} já completo(s), {failed} com falha)")
+    print(f"{len(urls)} página(s), {total_bytes / (1024 * 1024):.1f} MB"
+          + (f" ({len(urls) - len(known)} sem tamanho informado)" if len(known) < len(urls) else ""))
+    print(f"Tempo estimado: {_format_duration(estimate)} com {rate:g} req/s"
+          + (f" e {ratelimit.BYTES_POR_SEGUNDO / 1024:g} KB/s" if ratelimit.BYTES_POR_SEGUNDO
+             else " (sem --banda, conta só o limite de requisições)"))
+    return {
+        'capitulos': len(chapters),
+        'completos': complete,
+        'falhas': failed,
+        'paginas': len(urls),
+        'bytes': int(total_bytes),
+        'sem_tamanho': len(urls) - len(known),
+        'estimativa_s': estimate,
+    }
+
+def process_json_file(json_file_path, max_chapters=scheduler.CAPITULOS_SIMULTANEOS):
+    """
+    Processa um arquivo JSON contendo links de capítulos
+    """
+    try:
+        jobs = scheduler.jobs_from_json(json_file_path)
     except Exception as e:
         print(f"Erro ao processar arquivo JSON {json_file_path}: {e}")
         return False
+    
+    download_chapters(jobs, max_chapters)
+    return True
+
+def add_adaptive_arguments(parser):
+    """
+    Adiciona os tetos do controle adaptativo a um ArgumentParser
+    """
+    parser.add_argument('--conexoes-max', type=int,
+                        help="Até quantas conexões por host o controle adaptativo pode subir (padrão: 3x --conexoes)")
+    parser.add_argument('--rps-max', type=float,
+                        help="Até quantas requisições por segundo o controle adaptativo pode subir (padrão: 3x --rps)")
+
+def add_processing_arguments(parser):
+    """
+    Adiciona as opções de recodificação das páginas a um ArgumentParser
+    """
+    parser.add_argument('--formato', choices=sorted(imaging.FORMATOS),
+                        help="Recodifica as páginas neste formato (requer Pillow)")
+    parser.add_argument('--qualidade', type=int, default=imaging.QUALIDADE_PADRAO,
+                        help="Qualidade das páginas recodificadas (1 a 95)")
+    parser.add_argument('--altura-max', type=int,
+                        help="Reduz as páginas mais altas que isto (pixels); sem --formato, usa JPEG")
+    parser.add_argument('--processos', type=int,
+                        help="Processos de recodificação (padrão: número de núcleos)")
+
+def add_download_arguments(parser):
+    """
+    Adiciona as opções de download compartilhadas pelo cap.py e pelos modos
+    não interativos
+    """
+    parser.add_argument('--capitulos', type=int, default=scheduler.CAPITULOS_SIMULTANEOS,
+                        help="Número de capítulos baixados ao mesmo tempo")
+    parser.add_argument('--conexoes', type=int, default=MAX_CONEXOES_POR_HOST,
+                        help="Máximo de conexões simultâneas por host")
+    parser.add_argument('--rps', type=float, default=ratelimit.REQUISICOES_POR_SEGUNDO,
+                        help="Limite global de requisições por segundo (0 = sem limite)")
+    add_adaptive_arguments(parser)
+    add_processing_arguments(parser)
+    parser.add_argument('--memoria', type=float, default=ratelimit.MAX_BYTES_EM_MEMORIA / (1024 * 1024),
+                        help="Máximo de MB de imagens mantidos em memória")
+    parser.add_argument('--banda', type=float, default=ratelimit.BYTES_POR_SEGUNDO / 1024,
+                        help="Limite de KB/s das imagens somando todos os downloads (0 = sem limite)")
+    parser.add_argument('--cbz', action='store_true',
+                        help="Grava cada capítulo direto em um arquivo CBZ com ComicInfo.xml")
+    parser.add_argument('--manter-paginas', action='store_true',
+                        help="No modo --cbz, também mantém as páginas soltas em pages/")
+    parser.add_argument('--dedup', action='store_true',
+                        help="Guarda páginas em mangas/.store/ e liga as repetidas por hardlink")
+    scheduler.add_arguments(parser)
+    httpcache.add_arguments(parser)
+    metrics.add_arguments(parser)
+
+def configure_download(args):
+    """
+    Aplica as opções de download e inicia as métricas pedidas
+    """
+    configure(args.conexoes, args.rps, args.conexoes_max, args.rps_max)
+    ratelimit.configure_memory(args.memoria * 1024 * 1024)
+    ratelimit.configure_bandwidth(args.banda * 1024)
+    configure_output(args.cbz, args.manter_paginas, args.dedup)
+    configure_processing(args.formato, args.qualidade, args.altura_max, args.processos)
+    scheduler.configure_from_args(args)
+    httpcache.configure_from_args(args)
+    metrics.start(args)
+
+def parse_args(argv):
+    """
+    Interpreta os argumentos de linha de comando
+    """
+    parser = argparse.ArgumentParser(description="Sakura Mangas Downloader - download de capítulos")
+    parser.add_argument('entradas', nargs='*', help="Links de capítulos ou arquivos links_caps.json (separados por vírgula)")
+    parser.add_argument('--simular', action='store_true',
+                        help="Só resolve os capítulos e mostra páginas, tamanho e tempo estimado, sem baixar imagens")
+    add_download_arguments(parser)
+    return parser.parse_args(argv)
 
 def main():
     # Verifica se algum argumento foi fornecido
@@ -219,23 +1029,27 @@ def main():
         print("\nModo de uso:")
         print("  python cap.py link1,link2,link3")
         print("  python cap.py caminho/para/arquivo1.json,caminho/para/arquivo2.json")
+        print("  python cap.py --capitulos 4 --conexoes 6 --rps 5 arquivo.json")
         print("\nOu execute interativamente:")
         run_interactive()
         return
     
-    # Processa todos os argumentos
-    all_args = ','.join(sys.argv[1:])
-    args_list = [arg.strip() for arg in all_args.split(',')]
-    
-    for arg in args_list:
-        if arg.lower().endswith('.json'):
-            print(f"\nProcessando arquivo JSON: {arg}")
-            process_json_file(arg)
-        elif arg.startswith('http'):
-            print(f"\nProcessando URL: {arg}")
-            download_chapter(arg)
-        else:
-            print(f"Argumento não reconhecido: {arg}")
+    args = parse_args(sys.argv[1:])
+    configure_download(args)
+    
+    # Junta todas as entradas em uma única fila de capítulos
+    all_args = ','.join(args.entradas)
+    args_list = [arg.strip() for arg in all_args.split(',') if arg.strip()]
+    
+    jobs = scheduler.collect_jobs(args_list)
+    print(f"\n{len(jobs)} capítulo(s) na fila")
+    try:
+        if args.simular:
+            plan_chapters(jobs, args.capitulos)
+            return
+        download_chapters(jobs, args.capitulos)
+    finally:
+        metrics.finish(args)
 
 def run_interactive():
     """
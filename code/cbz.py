@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import shutil
+import zipfile
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+
+COMIC_INFO_NAME = 'ComicInfo.xml'
+
+def cbz_path(chapter_folder):
+    """
+    Caminho do arquivo CBZ de um capítulo (ao lado da pasta do capítulo)
+    """
+    return os.path.normpath(chapter_folder) + '.cbz'
+
+def _load_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def build_comic_info(chapter_folder, page_count):
+    """
+    Monta o ComicInfo.xml a partir do capitulo_info.json e do manga_info.json
+    """
+    chapter_info = _load_json(os.path.join(chapter_folder, 'capitulo_info.json'))
+    manga_info = _load_json(os.path.join(os.path.dirname(os.path.normpath(chapter_folder)), 'manga_info.json'))
+    manga = chapter_info.get('manga') or {}
+    capitulo = chapter_info.get('capitulo') or {}
+
+    fields = [
+        ('Title', capitulo.get('titulo')),
+        ('Series', manga.get('titulo') or manga_info.get('titulo')),
+        ('Number', capitulo.get('numero')),
+        ('Summary', manga_info.get('sinopse')),
+        ('Writer', manga_info.get('autor')),
+        ('Penciller', manga_info.get('artista')),
+        ('Genre', manga_info.get('generos') or manga_info.get('genero')),
+        ('PageCount', page_count),
+        ('LanguageISO', 'pt'),
+        ('Manga', 'Yes'),
+    ]
+
+    root = ET.Element('ComicInfo')
+    for tag, value in fields:
+        if value is None or value == '' or value == []:
+            continue
+        if isinstance(value, list):
+            value = ', '.join(str(item.get('nome', item)) if isinstance(item, dict) else str(item) for item in value)
+        ET.SubElement(root, tag).text = str(value)
+    return ET.tostring(root, encoding='utf-8', xml_declaration=True)
+
+class CbzWriter:
+    """
+    Arquivo CBZ de um capítulo, alimentado página a página pelos workers de
+    download. As páginas são gravadas sem compressão (ZIP_STORED), já que JPEG
+    não comprime. Com a ordem das páginas definida, as entradas do ZIP seguem
+    essa ordem: uma página que chega antes das anteriores espera em um
+    temporário no disco. O arquivo só recebe o nome final em close() se completo
+    """
+    def __init__(self, chapter_folder):
+        self.chapter_folder = chapter_folder
+        self.path = cbz_path(chapter_folder)
+        self.part_path = self.path + '.part'
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.order = None
+        self.next_position = 0
+        self.held = {}
+        self.zip = zipfile.ZipFile(self.part_path, 'w', compression=zipfile.ZIP_STORED)
+
+    def set_order(self, filenames):
+        """
+        Define a ordem das páginas pelos nomes originais; a extensão é
+        ignorada, já que páginas recodificadas mudam de extensão
+        """
+        with self.lock:
+            self.order = {os.path.splitext(name)[0]: position for position, name in enumerate(filenames)}
+
+    def _write_locked(self, filename, source):
+        info = zipfile.ZipInfo(filename, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        with self.zip.open(info, 'w', force_zip64=True) as entry:
+            shutil.copyfileobj(source, entry, 64 * 1024)
+        self.pages += 1
+
+    def _flush_held_locked(self, everything=False):
+        while self.held and (everything or self.next_position in self.held):
+            position = self.next_position if self.next_position in self.held else min(self.held)
+            filename, held = self.held.pop(position)
+            with held:
+                held.seek(0)
+                self._write_locked(filename, held)
+            self.next_position = position + 1
+
+    def add_page(self, filename, source):
+        """
+        Copia uma página de um arquivo aberto (posicionado no início) para o CBZ
+        """
+        with self.lock:
+            position = self.order.get(os.path.splitext(filename)[0]) if self.order else None
+            if position is not None and position > self.next_position:
+                held = tempfile.TemporaryFile()
+                shutil.copyfileobj(source, held, 64 * 1024)
+                self.held[position] = (filename, held)
+                return
+            self._write_locked(filename, source)
+            if position is not None:
+                self.next_position = position + 1
+                self._flush_held_locked()
+
+    def add_file(self, filename, path):
+        with open(path, 'rb') as source:
+            self.add_page(filename, source)
+
+    def close(self, complete):
+        """
+        Grava o ComicInfo.xml e publica o CBZ; se incompleto, descarta o .part
+        """
+        with self.lock:
+            if complete:
+                self._flush_held_locked(everything=True)
+                self.zip.writestr(COMIC_INFO_NAME, build_comic_info(self.chapter_folder, self.pages))
+            for _, held in self.held.values():
+                held.close()
+            self.held.clear()
+            self.zip.close()
+            if complete:
+                os.replace(self.part_path, self.path)
+            else:
+                os.remove(self.part_path)
@@ -0,0 +1,145 @@
+import os
+import threading
+import requests
+import time
+import adaptive
+import httpcache
+import metrics
+import ratelimit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Pode ser trocada (ex.: servidor local de benchmark) pela variável SAKURA_BASE_URL
+BASE_URL = os.environ.get('SAKURA_BASE_URL', 'https://sakuramangas.org').rstrip('/')
+
+# Tempo limite padrão (conexão, leitura) em segundos
+TIMEOUT_PADRAO = (10, 30)
+# Tamanho do pool de conexões mantidas abertas por host
+TAMANHO_POOL = 8
+# Tentativas em erros de conexão e respostas 5xx
+TENTATIVAS = 3
+# Tentativas extras quando o servidor responde 429 ou 503
+TENTATIVAS_LIMITACAO = 3
+# Fator do backoff exponencial entre tentativas (0.5s, 1s, 2s...)
+BACKOFF = 0.5
+
+API_HEADERS = {
+    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+    'X-Requested-With': 'XMLHttpRequest'
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+def create_session(pool_size=TAMANHO_POOL, retries=TENTATIVAS, backoff=BACKOFF):
+    """
+    Cria uma sessão HTTP com keep-alive, pool de conexões e retentativas
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        # 429 e 503 ficam com o controle adaptativo, que reduz o ritmo
+        status_forcelist=(500, 502, 504),
+        allowed_methods=None,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def configure(pool_size=TAMANHO_POOL, retries=TENTATIVAS, backoff=BACKOFF):
+    """
+    Recria a sessão compartilhada, por exemplo para ajustar o pool à concorrência
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = create_session(pool_size, retries, backoff)
+    return _session
+
+def get_session():
+    """
+    Retorna a sessão compartilhada, criando-a na primeira chamada
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+def request(method, url, **kwargs):
+    """
+    Faz uma requisição pela sessão compartilhada, respeitando o limite global
+    de requisições e registrando latência, status e retentativas. Respostas
+    429/503 e timeouts reduzem o ritmo do controle adaptativo; 429/503 são
+    repetidas depois do Retry-After (ou de um backoff exponencial). Com o
+    cache HTTP ligado, respostas guardadas dos endpoints da API não vão à rede
+    """
+    cached = httpcache.lookup(method, url, kwargs)
+    if cached is not None:
+        return cached
+    kwargs.setdefault('timeout', TIMEOUT_PADRAO)
+    controller = adaptive.get_controller()
+    endpoint = metrics.endpoint_name(url)
+    
+    for attempt in range(TENTATIVAS_LIMITACAO + 1):
+        controller.wait_if_blocked()
+        waited = ratelimit.get_limiter().acquire()
+        if waited:
+            metrics.inc('sakura_sleep_seconds_total', waited, motivo='limite_requisicoes')
+        
+        start = time.perf_counter()
+        try:
+            response = get_session().request(method, url, **kwargs)
+        except requests.Timeout:
+            metrics.inc('sakura_request_errors_total', endpoint=endpoint)
+            controller.on_throttle()
+            raise
+        except Exception:
+            metrics.inc('sakura_request_errors_total', endpoint=endpoint)
+            raise
+        elapsed = time.perf_counter() - start
+        metrics.record_response(url, response, elapsed)
+        
+        if response.status_code not in adaptive.STATUS_LIMITACAO:
+            # Só respostas 2xx/3xx contam como saudáveis para o crescimento
+            if 200 <= response.status_code < 400:
+                controller.on_success(elapsed)
+            httpcache.store(method, url, kwargs, response)
+            return response
+        
+        retry_after = adaptive.parse_retry_after(response.headers.get('Retry-After'))
+        controller.on_throttle(retry_after)
+        if attempt == TENTATIVAS_LIMITACAO:
+            return response
+        response.close()
+        if retry_after is None:
+            delay = BACKOFF * (2 ** attempt)
+            metrics.inc('sakura_sleep_seconds_total', delay, motivo='backoff')
+            time.sleep(delay)
+
+def get(url, **kwargs):
+    """
+    Faz uma requisição GET pela sessão compartilhada
+    """
+    return request('GET', url, **kwargs)
+
+def head(url, **kwargs):
+    """
+    Faz uma requisição HEAD pela sessão compartilhada, seguindo redirecionamentos
+    """
+    kwargs.setdefault('allow_redirects', True)
+    return request('HEAD', url, **kwargs)
+
+def post(url, **kwargs):
+    """
+    Faz uma requisição POST pela sessão compartilhada
+    """
+    return request('POST', url, **kwargs)
@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import requests
+import metrics
+from urllib.parse import parse_qsl, urlencode
+from requests.structures import CaseInsensitiveDict
+
+CACHE_PATH = os.path.join('mangas', '.cache', 'http.db')
+
+MODO_DESLIGADO = 'desligado'
+MODO_GRAVAR = 'gravar'
+MODO_REPLAY = 'replay'
+# desligado: sempre acessa a rede; gravar: reaproveita respostas válidas e
+# grava as novas; replay: responde só do cache, sem acessar a rede
+MODO = MODO_DESLIGADO
+
+# Validade das respostas por endpoint (segundos). Páginas HTML (0) são
+# guardadas só para o modo replay, já que trazem o token da sessão
+TTL_ENDPOINTS = {
+    'manga_info.php': 3600,
+    'manga_capitulos.php': 600,
+    'capitulos_info.php': 7 * 24 * 3600,
+    'capitulos_read.php': 7 * 24 * 3600,
+    'pagina': 0,
+}
+# Parâmetros que não entram na chave: o token muda sem mudar a resposta
+PARAMETROS_IGNORADOS = ('token',)
+# Cabeçalhos da resposta guardados junto com o corpo
+CABECALHOS_GUARDADOS = ('Content-Type', 'ETag', 'Last-Modified')
+# Requisições condicionais querem saber do servidor se algo mudou
+CABECALHOS_CONDICIONAIS = ('If-None-Match', 'If-Modified-Since')
+# Tamanho máximo do cache em disco; as respostas usadas há mais tempo saem primeiro
+TAMANHO_MAXIMO = 256 * 1024 * 1024
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS respostas (
+    chave TEXT PRIMARY KEY,
+    endpoint TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    cabecalhos TEXT NOT NULL,
+    corpo BLOB NOT NULL,
+    tamanho INTEGER NOT NULL,
+    gravado REAL NOT NULL,
+    usado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS respostas_usado ON respostas (usado);
+'''
+
+_local = threading.local()
+
+class CacheMiss(requests.ConnectionError):
+    """
+    Resposta ausente do cache no modo replay
+    """
+
+def configure(mode=MODO_GRAVAR, max_bytes=TAMANHO_MAXIMO):
+    global MODO, TAMANHO_MAXIMO
+    MODO = mode
+    TAMANHO_MAXIMO = max_bytes
+
+def connect():
+    """
+    Retorna a conexão SQLite da thread atual, criando o cache se necessário
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+        conn = sqlite3.connect(CACHE_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+def _params(data):
+    if not data:
+        return []
+    if isinstance(data, (bytes, str)):
+        data = parse_qsl(data.decode() if isinstance(data, bytes) else data, keep_blank_values=True)
+    elif isinstance(data, dict):
+        data = data.items()
+    return [(str(key), str(value)) for key, value in data]
+
+def cache_key(method, url, kwargs):
+    """
+    Chave da requisição: método, URL e parâmetros do formulário e da query
+    em ordem, sem os parâmetros que só autenticam
+    """
+    params = _params(kwargs.get('params')) + _params(kwargs.get('data'))
+    params = sorted((key, value) for key, value in params if key not in PARAMETROS_IGNORADOS)
+    text = f"{method.upper()} {url}?{urlencode(params)}"
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _cacheable(url, kwargs):
+    """
+    TTL do endpoint da requisição, ou None se ela não passa pelo cache
+    """
+    if MODO == MODO_DESLIGADO or kwargs.get('stream'):
+        return None
+    headers = kwargs.get('headers') or {}
+    if MODO != MODO_REPLAY and any(name in headers for name in CABECALHOS_CONDICIONAIS):
+        return None
+    return TTL_ENDPOINTS.get(metrics.endpoint_name(url))
+
+def _build_response(url, row):
+    response = requests.Response()
+    response.status_code = row['status']
+    response._content = bytes(row['corpo'])
+    response.headers = CaseInsensitiveDict(json.loads(row['cabecalhos']))
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.url = url
+    response.reason = 'OK'
+    return response
+
+def lookup(method, url, kwargs):
+    """
+    Resposta guardada e ainda válida para a requisição, ou None. No modo
+    replay a validade é ignorada e a falta da resposta gera CacheMiss
+    """
+    ttl = _cacheable(url, kwargs)
+    if ttl is None:
+        if MODO == MODO_REPLAY:
+            raise CacheMiss(f"Modo replay: {url} não passa pelo cache")
+        return None
+
+    endpoint = metrics.endpoint_name(url)
+    key = cache_key(method, url, kwargs)
+    conn = connect()
+    row = conn.execute('SELECT * FROM respostas WHERE chave = ?', (key,)).fetchone()
+    now = time.time()
+    if row is None or (MODO != MODO_REPLAY and now - row['gravado'] >= ttl):
+        metrics.inc('sakura_http_cache_total', endpoint=endpoint, resultado='falta')
+        if MODO == MODO_REPLAY:
+            raise CacheMiss(f"Modo replay: resposta de {endpoint} não encontrada no cache")
+        return None
+
+    with conn:
+        conn.execute('UPDATE respostas SET usado = ? WHERE chave = ?', (now, key))
+    metrics.inc('sakura_http_cache_total', endpoint=endpoint, resultado='acerto')
+    return _build_response(url, row)
+
+def store(method, url, kwargs, response):
+    """
+    Guarda uma resposta 200 da requisição e descarta as usadas há mais tempo
+    se o cache passar de TAMANHO_MAXIMO
+    """
+    if MODO != MODO_GRAVAR or response.status_code != 200 or _cacheable(url, kwargs) is None:
+        return
+    body = response.content
+    headers = {name: response.headers[name] for name in CABECALHOS_GUARDADOS if name in response.headers}
+    now = time.time()
+    conn = connect()
+    with conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO respostas (chave, endpoint, status, cabecalhos, corpo, tamanho, gravado, usado)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (cache_key(method, url, kwargs), metrics.endpoint_name(url), response.status_code,
+              json.dumps(headers), body, len(body), now, now))
+        conn.execute('''
+            DELETE FROM respostas WHERE chave IN (
+                SELECT chave FROM (
+                    SELECT chave, SUM(tamanho) OVER (ORDER BY usado DESC, chave) AS acumulado
+                    FROM respostas
+                ) WHERE acumulado > ?
+            )
+        ''', (TAMANHO_MAXIMO,))
+
+def invalidate(method, url, kwargs):
+    """
+    Descarta a resposta guardada para a requisição. Usado quando a resposta
+    veio com status 200 mas sem os dados esperados (ex.: token recusado),
+    para que a nova tentativa vá à rede
+    """
+    if MODO != MODO_GRAVAR or _cacheable(url, kwargs) is None:
+        return
+    conn = connect()
+    with conn:
+        conn.execute('DELETE FROM respostas WHERE chave = ?', (cache_key(method, url, kwargs),))
+
+def add_arguments(parser):
+    """
+    Adiciona as opções do cache de respostas a um ArgumentParser
+    """
+    parser.add_argument('--cache-http', action='store_true',
+                        help="Guarda as respostas da API em mangas/.cache/http.db e as reaproveita enquanto válidas")
+    parser.add_argument('--replay', action='store_true',
+                        help="Responde só a partir do cache HTTP, sem acessar a rede")
+    parser.add_argument('--cache-http-mb', type=float, default=TAMANHO_MAXIMO / (1024 * 1024),
+                        help="Tamanho máximo do cache HTTP em MB")
+
+def configure_from_args(args):
+    """
+    Aplica as opções do cache de respostas da linha de comando
+    """
+    if args.replay:
+        configure(MODO_REPLAY, args.cache_http_mb * 1024 * 1024)
+    elif args.cache_http:
+        configure(MODO_GRAVAR, args.cache_http_mb * 1024 * 1024)
@@ -0,0 +1,127 @@
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Formatos de saída aceitos e a extensão usada para cada um
+FORMATOS = {'webp': '.webp', 'jpeg': '.jpg'}
+# Qualidade padrão das páginas recodificadas (1 a 95)
+QUALIDADE_PADRAO = 80
+# Páginas baixadas aguardando recodificação, por processo
+FILA_POR_PROCESSO = 2
+
+def available():
+    """
+    Indica se o Pillow está instalado
+    """
+    return Image is not None
+
+def output_filename(filename, image_format):
+    """
+    Nome final de uma página depois de recodificada no formato informado
+    """
+    return os.path.splitext(filename)[0] + FORMATOS[image_format]
+
+def encode_page(source, dest, image_format, quality, max_height=None):
+    """
+    Recodifica a página source em dest (WebP ou JPEG com qualidade limitada),
+    reduzindo para max_height de altura se for maior. Roda em um processo
+    separado. Se o JPEG recodificado não ficar menor, mantém o original.
+    Retorna o caminho final
+    """
+    resized = False
+    with Image.open(source) as image:
+        source_format = image.format
+        image.load()
+        if max_height and image.height > max_height:
+            width = max(1, round(image.width * max_height / image.height))
+            image = image.resize((width, max_height), Image.LANCZOS)
+            resized = True
+        if image_format == 'jpeg' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        elif image_format == 'webp' and image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+        tmp_path = dest + '.tmp'
+        try:
+            if image_format == 'webp':
+                image.save(tmp_path, format='WEBP', quality=quality, method=4)
+            else:
+                image.save(tmp_path, format='JPEG', quality=quality, optimize=True)
+        except Exception:
+            # Não deixa um .tmp pela metade na pasta de páginas
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    keep_original = (image_format == 'jpeg' and source_format == 'JPEG' and not resized
+                     and os.path.getsize(tmp_path) >= os.path.getsize(source))
+    if keep_original:
+        os.remove(tmp_path)
+        tmp_path = source
+    os.replace(tmp_path, dest)
+    if source != dest and os.path.exists(source):
+        os.remove(source)
+    return dest
+
+class PostProcessor:
+    """
+    Recodifica páginas em um pool de processos enquanto os downloads
+    continuam nas threads de rede. A fila entre as duas etapas é limitada:
+    quem baixou uma página espera por uma vaga antes de entregá-la
+    """
+    def __init__(self, image_format='webp', quality=QUALIDADE_PADRAO, max_height=None, workers=None):
+        if image_format not in FORMATOS:
+            raise ValueError(f"Formato desconhecido: {image_format}")
+        self.image_format = image_format
+        self.quality = quality
+        self.max_height = max_height
+        self.workers = workers or os.cpu_count() or 1
+        self.slots = threading.BoundedSemaphore(self.workers * FILA_POR_PROCESSO)
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def output_filename(self, filename):
+        return output_filename(filename, self.image_format)
+
+    def _get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self.executor
+
+    def submit(self, source, dest, finish):
+        """
+        Agenda a recodificação de source em dest. Quando terminar, chama
+        finish(caminho_final) e o Future retornado recebe o seu resultado
+        (False se a recodificação falhar)
+        """
+        self.slots.acquire()
+        done = Future()
+        try:
+            encoded = self._get_executor().submit(encode_page, source, dest, self.image_format,
+                                                  self.quality, self.max_height)
+        except Exception:
+            self.slots.release()
+            raise
+
+        def callback(encoded):
+            self.slots.release()
+            try:
+                done.set_result(finish(encoded.result()))
+            except Exception as e:
+                print(f"Erro ao processar {os.path.basename(source)}: {e}")
+                done.set_result(False)
+
+        encoded.add_done_callback(callback)
+        return done
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
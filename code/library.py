@@ -0,0 +1,246 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_PATH = os.path.join('mangas', 'biblioteca.db')
+
+STATUS_PENDENTE = 'pendente'
+STATUS_COMPLETO = 'completo'
+STATUS_FALHOU = 'falhou'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS mangas (
+    id INTEGER PRIMARY KEY,
+    manga_id TEXT UNIQUE,
+    titulo TEXT NOT NULL,
+    pasta TEXT NOT NULL UNIQUE,
+    ultimo_capitulo TEXT,
+    atualizado REAL
+);
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    nome TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS chapters (
+    id INTEGER PRIMARY KEY,
+    manga INTEGER REFERENCES mangas(id),
+    scan INTEGER REFERENCES scans(id),
+    link TEXT NOT NULL UNIQUE,
+    numero TEXT,
+    titulo TEXT,
+    chapter_id TEXT,
+    pasta TEXT,
+    status TEXT NOT NULL DEFAULT 'pendente',
+    atualizado REAL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    chapter INTEGER NOT NULL REFERENCES chapters(id),
+    arquivo TEXT NOT NULL,
+    url TEXT,
+    tamanho INTEGER,
+    sha256 TEXT,
+    status TEXT NOT NULL DEFAULT 'pendente',
+    UNIQUE (chapter, arquivo)
+);
+CREATE TABLE IF NOT EXISTS watch (
+    url TEXT PRIMARY KEY,
+    manga_id TEXT,
+    token TEXT,
+    token_ts REAL,
+    ultimo_capitulo TEXT,
+    etag TEXT,
+    modificado TEXT,
+    verificado REAL,
+    proxima REAL
+);
+CREATE INDEX IF NOT EXISTS chapters_manga_status ON chapters (manga, status);
+CREATE INDEX IF NOT EXISTS chapters_pasta ON chapters (pasta);
+CREATE INDEX IF NOT EXISTS pages_sha256 ON pages (sha256);
+CREATE INDEX IF NOT EXISTS pages_url ON pages (url);
+'''
+
+_local = threading.local()
+
+def connect():
+    """
+    Retorna a conexão SQLite da thread atual, criando o banco se necessário
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DB_PATH) or '.', exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+@contextmanager
+def transaction():
+    """
+    Executa um bloco de escritas como uma única transação
+    """
+    conn = connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        yield conn
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+def _scan_id(conn, scan_name):
+    if not scan_name:
+        return None
+    conn.execute('INSERT OR IGNORE INTO scans (nome) VALUES (?)', (scan_name,))
+    return conn.execute('SELECT id FROM scans WHERE nome = ?', (scan_name,)).fetchone()['id']
+
+def record_catalog(manga_id, manga_details, manga_dir, chapters_data):
+    """
+    Registra um mangá e a sua lista de capítulos (links_caps.json)
+    """
+    now = time.time()
+    with transaction() as conn:
+        conn.execute('''
+            INSERT INTO mangas (manga_id, titulo, pasta, ultimo_capitulo, atualizado)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (pasta) DO UPDATE SET
+                manga_id = excluded.manga_id,
+                titulo = excluded.titulo,
+                ultimo_capitulo = excluded.ultimo_capitulo,
+                atualizado = excluded.atualizado
+        ''', (str(manga_id), manga_details.get('titulo', 'Desconhecido'), manga_dir,
+              str(manga_details.get('ultimo_capitulo', '')), now))
+        manga_pk = conn.execute('SELECT id FROM mangas WHERE pasta = ?', (manga_dir,)).fetchone()['id']
+
+        for chapter in chapters_data:
+            link = chapter.get('link-capitulo')
+            if not link:
+                continue
+            numero = chapter.get('num-capitulo')
+            conn.execute('''
+                INSERT INTO chapters (manga, scan, link, numero, titulo, pasta, atualizado)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (link) DO UPDATE SET
+                    manga = excluded.manga,
+                    scan = excluded.scan,
+                    numero = excluded.numero,
+                    titulo = excluded.titulo,
+                    pasta = COALESCE(chapters.pasta, excluded.pasta)
+            ''', (manga_pk, _scan_id(conn, chapter.get('scan-nome')), link, numero,
+                  chapter.get('cap-titulo'), os.path.join(manga_dir, str(numero)), now))
+    return manga_pk
+
+def manga_last_chapter(manga_id):
+    """
+    ultimo_capitulo registrado para um mangá pelo último catálogo, ou None
+    """
+    row = connect().execute(
+        'SELECT ultimo_capitulo FROM mangas WHERE manga_id = ?', (str(manga_id),)
+    ).fetchone()
+    return row['ultimo_capitulo'] if row else None
+
+def watch_state(url):
+    """
+    Estado da lista de acompanhamento para a URL de uma obra, ou {}
+    """
+    row = connect().execute('SELECT * FROM watch WHERE url = ?', (url,)).fetchone()
+    return dict(row) if row else {}
+
+def save_watch_state(url, **fields):
+    """
+    Atualiza os campos informados do estado de acompanhamento de uma obra
+    """
+    columns = ['url'] + list(fields)
+    updates = ', '.join(f'{column} = excluded.{column}' for column in fields)
+    with transaction() as conn:
+        conn.execute(f'''
+            INSERT INTO watch ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})
+            ON CONFLICT (url) DO UPDATE SET {updates}
+        ''', [url] + list(fields.values()))
+
+def record_chapter(link, status, chapter_id=None, chapter_folder=None, numero=None, pages=None):
+    """
+    Atualiza o status de um capítulo e, opcionalmente, das suas páginas
+    (dicionário arquivo -> {url, size, sha256} do manifesto)
+    """
+    now = time.time()
+    with transaction() as conn:
+        conn.execute('''
+            INSERT INTO chapters (link, numero, chapter_id, pasta, status, atualizado)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (link) DO UPDATE SET
+                numero = COALESCE(excluded.numero, chapters.numero),
+                chapter_id = COALESCE(excluded.chapter_id, chapters.chapter_id),
+                pasta = COALESCE(excluded.pasta, chapters.pasta),
+                status = excluded.status,
+                atualizado = excluded.atualizado
+        ''', (link, None if numero is None else str(numero), chapter_id, chapter_folder, status, now))
+
+        if pages:
+            chapter_pk = conn.execute('SELECT id FROM chapters WHERE link = ?', (link,)).fetchone()['id']
+            conn.executemany('''
+                INSERT INTO pages (chapter, arquivo, url, tamanho, sha256, status)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (chapter, arquivo) DO UPDATE SET
+                    url = excluded.url,
+                    tamanho = excluded.tamanho,
+                    sha256 = excluded.sha256,
+                    status = excluded.status
+            ''', [(chapter_pk, filename, entry.get('url'), entry.get('size'), entry.get('sha256'), STATUS_COMPLETO)
+                  for filename, entry in pages.items()])
+
+def set_folder_status(chapter_folder, status):
+    """
+    Atualiza o status do capítulo gravado em chapter_folder, se indexado.
+    O caminho é comparado na forma relativa em que o cap.py o grava
+    (mangas/<título>/<número>). Retorna quantos capítulos foram atualizados
+    """
+    folder = os.path.relpath(os.path.abspath(chapter_folder))
+    with transaction() as conn:
+        cursor = conn.execute('UPDATE chapters SET status = ?, atualizado = ? WHERE pasta = ?',
+                              (status, time.time(), folder))
+        return cursor.rowcount
+
+def page_hash_for_url(url):
+    """
+    sha256 de uma página já baixada a partir da sua URL, ou None
+    """
+    row = connect().execute(
+        'SELECT sha256 FROM pages WHERE url = ? AND status = ? AND sha256 IS NOT NULL LIMIT 1',
+        (url, STATUS_COMPLETO)
+    ).fetchone()
+    return row['sha256'] if row else None
+
+def links_files():
+    """
+    Caminhos dos links_caps.json de todos os mangás registrados
+    """
+    rows = connect().execute('SELECT pasta FROM mangas ORDER BY titulo').fetchall()
+    paths = [os.path.join(row['pasta'], 'links_caps.json') for row in rows]
+    return [path for path in paths if os.path.exists(path)]
+
+# Capítulos pendentes cujo número ainda não tem nenhum upload completo (de
+# qualquer scan) no mesmo mangá
+_MISSING = '''
+    chapters.status != :completo AND NOT EXISTS (
+        SELECT 1 FROM chapters AS done
+        WHERE done.manga = chapters.manga AND done.numero = chapters.numero
+          AND done.status = :completo
+    )
+'''
+
+def missing_counts():
+    """
+    Quantidade de números de capítulo faltando por pasta de mangá
+    """
+    rows = connect().execute(f'''
+        SELECT mangas.pasta AS pasta, COUNT(DISTINCT chapters.numero) AS faltando
+        FROM mangas LEFT JOIN chapters ON chapters.manga = mangas.id AND {_MISSING}
+        GROUP BY mangas.id
+    ''', {'completo': STATUS_COMPLETO}).fetchall()
+    return {row['pasta']: row['faltando'] for row in rows}
@@ -2,10 +2,25 @@ import os
 import re
 import json
 import sys
-import requests
-from bs4 import BeautifulSoup
+import client
+import httpcache
+import library
+import metrics
+from bs4 import BeautifulSoup, SoupStrainer
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, parse_qs
 
+try:
+    import lxml
+    FAST_PARSER = 'lxml'
+except ImportError:
+    FAST_PARSER = 'html.parser'
+
+# Quantidade de capítulos retornados por página de manga_capitulos.php
+CAPITULOS_POR_PAGINA = 90
+# Número de páginas da lista de capítulos buscadas ao mesmo tempo
+PAGINAS_SIMULTANEAS = 4
+
 def create_directory(path):
     """Cria diretório se não existir"""
     if not os.path.exists(path):
@@ -15,7 +30,7 @@ def create_directory(path):
 def extract_manga_info(url):
     """Extrai manga_id e token de uma URL de capítulo de mangá"""
     try:
-        response = requests.get(url)
+        response = client.get(url)
         if response.status_code == 200:
             # Extrai manga-id e token usando regex
             manga_id_match = re.search(r'<meta\s+manga-id="(\d+)">', response.text)
@@ -43,110 +58,305 @@ def extract_manga_info(url):
         print(f"Erro ao extrair informações do mangá: {e}")
         return None
 
-def get_manga_details(manga_id, token):
-    """Obtém detalhes do mangá da API"""
-    url = 'https://sakuramangas.org/dist/sakura/models/manga/manga_info.php'
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        'X-Requested-With': 'XMLHttpRequest'
-    }
+@metrics.timed('sakura_stage_seconds', etapa='manga_info')
+def get_manga_details(manga_id, token, etag=None, last_modified=None, response_info=None):
+    """
+    Obtém detalhes do mangá da API. Com etag/last_modified a requisição é
+    condicional (If-None-Match/If-Modified-Since) e um 304 retorna None. Se
+    response_info for um dicionário, recebe o 'status' da resposta (None em
+    erro de conexão) e os validadores 'etag' e 'modificado'
+    """
+    url = client.BASE_URL + '/dist/sakura/models/manga/manga_info.php'
+    headers = dict(client.API_HEADERS)
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
     data = {
         'manga_id': manga_id,
         'token': token,
         'dataType': 'json'
     }
+    if response_info is not None:
+        response_info.update(status=None, etag=etag, modificado=last_modified)
     
     try:
-        response = requests.post(url, headers=headers, data=data)
+        response = client.post(url, headers=headers, data=data)
+        if response_info is not None:
+            response_info.update(status=response.status_code,
+                                 etag=response.headers.get('ETag', etag),
+                                 modificado=response.headers.get('Last-Modified', last_modified))
         if response.status_code == 200:
             return response.json()
-        else:
+        elif response.status_code != 304:
             print(f"Falha ao obter detalhes do mangá: {response.status_code}")
-            return None
+        return None
     except Exception as e:
         print(f"Erro ao obter detalhes do mangá: {e}")
         return None
 
-def get_manga_chapters(manga_id, token, last_chapter):
-    """Obtém todos os capítulos do mangá"""
-    url = 'https://sakuramangas.org/dist/sakura/models/manga/manga_capitulos.php'
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        'X-Requested-With': 'XMLHttpRequest'
+@metrics.timed('sakura_stage_seconds', etapa='lista_capitulos')
+def fetch_chapters_page(manga_id, token, offset, limit):
+    """Obtém o HTML de uma página da lista de capítulos"""
+    url = client.BASE_URL + '/dist/sakura/models/manga/manga_capitulos.php'
+    headers = client.API_HEADERS
+    data = {
+        'manga_id': manga_id,
+        'token': token,
+        'offset': offset,
+        'order': 'desc',
+        'limit': limit
     }
     
-    all_chapters_html = ""
-    all_chapters_data = []
+    try:
+        response = client.post(url, headers=headers, data=data)
+        if response.status_code == 200:
+            return response.text
+        print(f"Falha ao obter capítulos no offset {offset}: {response.status_code}")
+        return None
+    except Exception as e:
+        print(f"Erro ao obter capítulos do mangá: {e}")
+        return None
+
+def _find_chapter_items(chapters_html):
+    """
+    Encontra os blocos capitulo-item analisando só essas tags (com lxml, se
+    instalado) e recorre à análise completa com html.parser se nada for achado
+    """
+    strainer = SoupStrainer('div', class_='capitulo-item')
+    soup = BeautifulSoup(chapters_html, FAST_PARSER, parse_only=strainer)
+    chapter_items = soup.find_all('div', class_='capitulo-item')
+    if not chapter_items and 'capitulo-item' in chapters_html:
+        soup = BeautifulSoup(chapters_html, 'html.parser')
+        chapter_items = soup.find_all('div', class_='capitulo-item')
+    return chapter_items
+
+def parse_chapter_item(chapter):
+    """Extrai os campos de um bloco capitulo-item"""
+    chapter_num_span = chapter.find('span', class_='num-capitulo')
+    if not chapter_num_span:
+        return None
+        
+    chapter_num = chapter_num_span.get('data-chapter', '')
+    chapter_link_elem = chapter_num_span.find('a')
+    chapter_link = chapter_link_elem['href'] if chapter_link_elem else ''
+    title_span = chapter.find('span', class_='cap-titulo')
+    scan_span = chapter.find('span', class_='scan-nome')
+    
+    return {
+        "num-capitulo": chapter_num,
+        "cap-titulo": title_span.text.strip() if title_span else '',
+        "scan-nome": scan_span.text.strip() if scan_span else '',
+        "link-capitulo": chapter_link
+    }
+
+def parse_chapters_html(chapters_html):
+    """Retorna [(bloco, dados)] para cada capítulo de uma página da lista"""
+    parsed = []
+    for chapter in _find_chapter_items(chapters_html):
+        try:
+            chapter_data = parse_chapter_item(chapter)
+        except Exception as e:
+            print(f"Erro ao analisar capítulo: {e}")
+            continue
+        parsed.append((chapter, chapter_data))
+    return parsed
+
+def get_manga_chapters(manga_id, token, last_chapter, known_links=None):
+    """
+    Obtém todos os capítulos do mangá. Com known_links, funciona em modo
+    incremental: para no primeiro capítulo já conhecido e retorna só os novos,
+    ou None se uma página da lista falhar antes dele
+    """
+    if known_links is not None:
+        return _get_new_chapters(manga_id, token, known_links)
     
     # Calcula quantas requisições precisamos fazer
-    limit = 90
+    limit = CAPITULOS_POR_PAGINA
     requests_needed = (last_chapter // limit) + 1
+    offsets = [i * limit for i in range(requests_needed)]
+    
+    # Busca as páginas em paralelo; os resultados voltam na ordem dos offsets
+    with ThreadPoolExecutor(max_workers=max(1, min(PAGINAS_SIMULTANEAS, len(offsets)))) as executor:
+        pages = list(executor.map(lambda offset: fetch_chapters_page(manga_id, token, offset, limit), offsets))
     
-    for i in range(requests_needed):
-        offset = i * limit
-        data = {
-            'manga_id': manga_id,
-            'token': token,
-            'offset': offset,
-            'order': 'desc',
-            'limit': limit
-        }
+    html_parts = []
+    all_chapters_data = []
+    for chapters_html in pages:
+        if chapters_html is None:
+            break
+        html_parts.append(chapters_html)
         
-        try:
-            response = requests.post(url, headers=headers, data=data)
-            if response.status_code == 200:
-                chapters_html = response.text
-                all_chapters_html += chapters_html
-                
-                # Analisa o HTML para extrair informações dos capítulos
-                soup = BeautifulSoup(chapters_html, 'html.parser')
-                chapter_items = soup.find_all('div', class_='capitulo-item')
-                
-                for chapter in chapter_items:
-                    try:
-                        chapter_num_span = chapter.find('span', class_='num-capitulo')
-                        if not chapter_num_span:
-                            continue
-                            
-                        chapter_num = chapter_num_span.get('data-chapter', '')
-                        chapter_link_elem = chapter_num_span.find('a')
-                        chapter_link = chapter_link_elem['href'] if chapter_link_elem else ''
-                        chapter_title = chapter.find('span', class_='cap-titulo').text.strip() if chapter.find('span', class_='cap-titulo') else ''
-                        scan_name = chapter.find('span', class_='scan-nome').text.strip() if chapter.find('span', class_='scan-nome') else ''
-                        
-                        chapter_data = {
-                            "num-capitulo": chapter_num,
-                            "cap-titulo": chapter_title,
-                            "scan-nome": scan_name,
-                            "link-capitulo": chapter_link
-                        }
-                        all_chapters_data.append(chapter_data)
-                    except Exception as e:
-                        print(f"Erro ao analisar capítulo: {e}")
-                        continue
-                
-                # Se recebemos menos itens que o limite, podemos parar
-                if len(chapter_items) < limit:
-                    break
-                    
-            else:
-                print(f"Falha ao obter capítulos no offset {offset}: {response.status_code}")
-                break
-        except Exception as e:
-            print(f"Erro ao obter capítulos do mangá: {e}")
+        # Analisa o HTML para extrair informações dos capítulos
+        parsed = parse_chapters_html(chapters_html)
+        all_chapters_data.extend(data for _, data in parsed if data)
+        
+        # Se recebemos menos itens que o limite, as páginas seguintes estão vazias
+        if len(parsed) < limit:
             break
     
-    return all_chapters_html, all_chapters_data
+    return ''.join(html_parts), all_chapters_data
+
+def _get_new_chapters(manga_id, token, known_links):
+    """
+    Percorre a lista em ordem decrescente até o primeiro capítulo conhecido.
+    Retorna None se uma página falhar antes disso: os capítulos pulados não
+    seriam buscados de novo na próxima execução incremental
+    """
+    limit = CAPITULOS_POR_PAGINA
+    html_parts = []
+    new_chapters = []
+    offset = 0
+    
+    while True:
+        chapters_html = fetch_chapters_page(manga_id, token, offset, limit)
+        if chapters_html is None:
+            return None
+        
+        parsed = parse_chapters_html(chapters_html)
+        for chapter, chapter_data in parsed:
+            if not chapter_data:
+                continue
+            # A lista vem em ordem decrescente: tudo depois de um
+            # capítulo conhecido já está no links_caps.json
+            if chapter_data['link-capitulo'] in known_links:
+                return ''.join(html_parts), new_chapters
+            new_chapters.append(chapter_data)
+            html_parts.append(str(chapter))
+        
+        # Se recebemos menos itens que o limite, podemos parar
+        if len(parsed) < limit:
+            break
+        offset += limit
+    
+    return ''.join(html_parts), new_chapters
+
+def load_known_chapters(chapters_json_path):
+    """Carrega os capítulos já conhecidos de um links_caps.json existente"""
+    if not os.path.exists(chapters_json_path):
+        return None
+    try:
+        with open(chapters_json_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Erro ao ler {chapters_json_path}: {e}")
+        return None
+
+def fetch_catalog(url, incremental=False, manga_info=None, manga_details=None):
+    """
+    Busca os metadados e a lista de capítulos de um mangá e grava
+    manga_info.json, manga_caps.html e links_caps.json. Retorna um dicionário
+    com o título, a pasta, o caminho do links_caps.json, todos os capítulos e
+    os capítulos novos (todos, fora do modo incremental), ou None em caso de falha.
+    manga_info e manga_details já obtidos (ex.: pelo modo watch) evitam
+    repetir essas requisições
+    """
+    # Extrai ID do mangá e token
+    if manga_info is None:
+        manga_info = extract_manga_info(url)
+    if not manga_info:
+        print(f"Pulando URL: {url}")
+        return None
+    
+    manga_id = manga_info["manga_id"]
+    token = manga_info["token"]
+    
+    # Obtém detalhes do mangá
+    if manga_details is None:
+        manga_details = get_manga_details(manga_id, token)
+    if not manga_details:
+        print(f"Não foi possível obter detalhes do mangá para {url}")
+        return None
+    
+    # Cria estrutura de diretórios
+    manga_title = manga_details.get("titulo", "Desconhecido")
+    manga_dir = os.path.join("mangas", manga_title)
+    create_directory("mangas")
+    create_directory(manga_dir)
+    
+    # Salva informações do mangá
+    manga_info_path = os.path.join(manga_dir, "manga_info.json")
+    with open(manga_info_path, 'w', encoding='utf-8') as f:
+        json.dump(manga_details, f, ensure_ascii=False, indent=4)
+    print(f"Informações do mangá salvas em {manga_info_path}")
+    
+    # Obtém número do último capítulo
+    last_chapter = int(manga_details.get("ultimo_capitulo", 1))
+    
+    chapters_html_path = os.path.join(manga_dir, "manga_caps.html")
+    chapters_json_path = os.path.join(manga_dir, "links_caps.json")
+    
+    new_chapters = None
+    known_chapters = load_known_chapters(chapters_json_path) if incremental else None
+    if known_chapters:
+        # Busca só os capítulos mais novos que os já conhecidos
+        known_links = {chapter.get('link-capitulo') for chapter in known_chapters}
+        result = get_manga_chapters(manga_id, token, last_chapter, known_links)
+        if result is None:
+            print(f"Lista de capítulos incompleta para {url}, {chapters_json_path} não foi alterado")
+            return None
+        chapters_html, new_chapters = result
+        chapters_data = new_chapters + known_chapters
+        
+        if chapters_html:
+            previous_html = ''
+            if os.path.exists(chapters_html_path):
+                with open(chapters_html_path, 'r', encoding='utf-8') as f:
+                    previous_html = f.read()
+            chapters_html = chapters_html + previous_html
+        else:
+            chapters_html = None
+        
+        # Salva apenas os capítulos novos para serem baixados
+        new_chapters_path = os.path.join(manga_dir, "novos_caps.json")
+        with open(new_chapters_path, 'w', encoding='utf-8') as f:
+            json.dump(new_chapters, f, ensure_ascii=False, indent=4)
+        print(f"{len(new_chapters)} capítulo(s) novo(s) salvos em {new_chapters_path}")
+    else:
+        # Obtém todos os capítulos
+        chapters_html, chapters_data = get_manga_chapters(manga_id, token, last_chapter)
+    
+    # Salva HTML dos capítulos
+    if chapters_html is not None:
+        with open(chapters_html_path, 'w', encoding='utf-8') as f:
+            f.write(chapters_html)
+        print(f"HTML dos capítulos salvo em {chapters_html_path}")
+    
+    # Salva JSON dos capítulos
+    with open(chapters_json_path, 'w', encoding='utf-8') as f:
+        json.dump(chapters_data, f, ensure_ascii=False, indent=4)
+    print(f"JSON dos capítulos salvo em {chapters_json_path}")
+    
+    # Atualiza o índice da biblioteca
+    try:
+        library.record_catalog(manga_id, manga_details, manga_dir, chapters_data)
+    except Exception as e:
+        print(f"Erro ao atualizar o índice da biblioteca: {e}")
+    
+    print(f"Processamento de {manga_title} concluído")
+    return {
+        "titulo": manga_title,
+        "manga_dir": manga_dir,
+        "links_caps": chapters_json_path,
+        "chapters": chapters_data,
+        "new_chapters": chapters_data if new_chapters is None else new_chapters
+    }
 
 def main():
     # Verifica se argumentos de linha de comando foram fornecidos
     if len(sys.argv) < 2:
-        print("Uso: python manga.py {link} [{link} ...]")
+        print("Uso: python manga.py [--incremental] [--cache-http | --replay] {link} [{link} ...]")
         print("Exemplo: python manga.py https://sakuramangas.org/manga/one-piece/1 https://sakuramangas.org/manga/naruto/1")
         return
     
     # Obtém URLs de capítulos de mangá dos argumentos de linha de comando
-    manga_urls = sys.argv[1:]
+    flags = {'--incremental', '--cache-http', '--replay'}
+    incremental = '--incremental' in sys.argv[1:]
+    if '--replay' in sys.argv[1:]:
+        httpcache.configure(httpcache.MODO_REPLAY)
+    elif '--cache-http' in sys.argv[1:]:
+        httpcache.configure(httpcache.MODO_GRAVAR)
+    manga_urls = [arg for arg in sys.argv[1:] if arg not in flags]
     
     for url in manga_urls:
         # Limpa URL (remove vírgulas ou espaços extras)
@@ -156,53 +366,7 @@ def main():
             continue
             
         print(f"\nProcessando URL: {url}")
-        
-        # Extrai ID do mangá e token
-        manga_info = extract_manga_info(url)
-        if not manga_info:
-            print(f"Pulando URL: {url}")
-            continue
-        
-        manga_id = manga_info["manga_id"]
-        token = manga_info["token"]
-        
-        # Obtém detalhes do mangá
-        manga_details = get_manga_details(manga_id, token)
-        if not manga_details:
-            print(f"Não foi possível obter detalhes do mangá para {url}")
-            continue
-        
-        # Cria estrutura de diretórios
-        manga_title = manga_details.get("titulo", "Desconhecido")
-        manga_dir = os.path.join("mangas", manga_title)
-        create_directory("mangas")
-        create_directory(manga_dir)
-        
-        # Salva informações do mangá
-        manga_info_path = os.path.join(manga_dir, "manga_info.json")
-        with open(manga_info_path, 'w', encoding='utf-8') as f:
-            json.dump(manga_details, f, ensure_ascii=False, indent=4)
-        print(f"Informações do mangá salvas em {manga_info_path}")
-        
-        # Obtém número do último capítulo
-        last_chapter = int(manga_details.get("ultimo_capitulo", 1))
-        
-        # Obtém todos os capítulos
-        chapters_html, chapters_data = get_manga_chapters(manga_id, token, last_chapter)
-        
-        # Salva HTML dos capítulos
-        chapters_html_path = os.path.join(manga_dir, "manga_caps.html")
-        with open(chapters_html_path, 'w', encoding='utf-8') as f:
-            f.write(chapters_html)
-        print(f"HTML dos capítulos salvo em {chapters_html_path}")
-        
-        # Salva JSON dos capítulos
-        chapters_json_path = os.path.join(manga_dir, "links_caps.json")
-        with open(chapters_json_path, 'w', encoding='utf-8') as f:
-            json.dump(chapters_data, f, ensure_ascii=False, indent=4)
-        print(f"JSON dos capítulos salvo em {chapters_json_path}")
-        
-        print(f"Processamento de {manga_title} concluído")
+        fetch_catalog(url, incremental)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
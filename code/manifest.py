@@ -0,0 +1,118 @@
+import os
+import json
+import hashlib
+
+MANIFEST_NAME = 'manifest.json'
+
+JPEG_END = b'\xff\xd9'
+PNG_END = b'IEND\xaeB`\x82'
+WEBP_HEADER = b'RIFF'
+
+def manifest_path(chapter_folder):
+    return os.path.join(chapter_folder, MANIFEST_NAME)
+
+def load(chapter_folder):
+    """
+    Carrega o manifesto do capítulo ou retorna um manifesto vazio
+    """
+    try:
+        with open(manifest_path(chapter_folder), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data.setdefault('expected', [])
+    data.setdefault('pages', {})
+    data.setdefault('complete', False)
+    return data
+
+def save(chapter_folder, data):
+    """
+    Grava o manifesto de forma atômica (arquivo temporário + rename)
+    """
+    path = manifest_path(chapter_folder)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
+
+def file_digest(path):
+    """
+    Retorna (tamanho, sha256) de um arquivo
+    """
+    sha = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+            size += len(chunk)
+    return size, sha.hexdigest()
+
+def looks_complete(path):
+    """
+    Verifica se um arquivo de imagem termina com o marcador de fim do formato
+    """
+    try:
+        size = os.path.getsize(path)
+        if size == 0:
+            return False
+        with open(path, 'rb') as f:
+            head = f.read(12)
+            f.seek(max(0, size - 16))
+            tail = f.read()
+    except OSError:
+        return False
+    return has_end_marker(path, head, tail, size)
+
+def has_end_marker(path, head, tail, size):
+    """
+    Confere o início (12 bytes) e o fim (16 bytes) de uma página de tamanho
+    size contra o formato indicado pela extensão de path
+    """
+    lower = path.lower()
+    if lower.endswith('.webp'):
+        # O cabeçalho RIFF traz o tamanho do arquivo menos 8 bytes
+        return (head.startswith(WEBP_HEADER) and head[8:12] == b'WEBP'
+                and int.from_bytes(head[4:8], 'little') + 8 == size)
+    if lower.endswith(('.jpg', '.jpeg')):
+        return tail.rstrip(b'\x00').endswith(JPEG_END)
+    if lower.endswith('.png'):
+        return tail.endswith(PNG_END)
+    # Outros formatos: basta não estar vazio
+    return True
+
+def page_is_valid(path, entry):
+    """
+    Confere se a página existe com o tamanho registrado no manifesto
+    """
+    if not entry:
+        return False
+    try:
+        return os.path.getsize(path) == entry.get('size')
+    except OSError:
+        return False
+
+def page_path(pages_folder, filename, entry=None):
+    """
+    Caminho da página no disco; páginas recodificadas guardam o nome final
+    (ex.: 001.webp) no campo 'arquivo' do manifesto
+    """
+    if entry and entry.get('arquivo'):
+        return os.path.join(pages_folder, entry['arquivo'])
+    return os.path.join(pages_folder, filename)
+
+def is_complete(chapter_folder):
+    """
+    Indica se o capítulo já foi baixado por completo, sem acessar a rede
+    """
+    if not os.path.exists(manifest_path(chapter_folder)):
+        return False
+    data = load(chapter_folder)
+    if not data['complete'] or not data['expected']:
+        return False
+
+    pages_folder = os.path.join(chapter_folder, 'pages')
+    for filename in data['expected']:
+        entry = data['pages'].get(filename)
+        if not page_is_valid(page_path(pages_folder, filename, entry), entry):
+            return False
+    return True
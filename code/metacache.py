@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import atexit
+import threading
+from urllib.parse import urlparse
+
+CACHE_PATH = os.path.join('mangas', '.cache', 'resolucao.json')
+# Tempo que um chapter_id resolvido permanece no cache (segundos)
+TTL_CAPITULO = 30 * 24 * 3600
+# Tempo em que um token é considerado válido sem nova verificação (segundos)
+TTL_TOKEN = 6 * 3600
+# Máximo de capítulos mantidos; os usados há mais tempo saem primeiro
+MAX_ENTRADAS = 50000
+# Quantidade de alterações acumuladas antes de gravar o cache em disco
+GRAVAR_A_CADA = 25
+
+_lock = threading.Lock()
+_cache = None
+_dirty = 0
+
+def _manga_key(url):
+    """
+    Chave do mangá a partir da URL do capítulo (caminho sem o último trecho)
+    """
+    parts = urlparse(url).path.strip('/').split('/')
+    if len(parts) < 3:
+        return None
+    return '/'.join(parts[:-1])
+
+def _load():
+    global _cache
+    if _cache is None:
+        try:
+            with open(CACHE_PATH, 'r', encoding='utf-8') as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            _cache = {}
+        _cache.setdefault('capitulos', {})
+        _cache.setdefault('mangas', {})
+        _expire(time.time())
+    return _cache
+
+def _expire(now):
+    chapters = _cache['capitulos']
+    for url in [url for url, entry in chapters.items() if now - entry['resolvido'] > TTL_CAPITULO]:
+        del chapters[url]
+    mangas = _cache['mangas']
+    for key in [key for key, entry in mangas.items() if now - entry['ts'] > TTL_TOKEN]:
+        del mangas[key]
+    if len(chapters) > MAX_ENTRADAS:
+        oldest = sorted(chapters, key=lambda url: chapters[url]['usado'])
+        for url in oldest[:len(chapters) - MAX_ENTRADAS]:
+            del chapters[url]
+
+def _save_locked():
+    global _dirty
+    if _cache is None or not _dirty:
+        return
+    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+    # Nome por processo: vários workers da fila podem gravar ao mesmo tempo
+    tmp_path = f'{CACHE_PATH}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_cache, f, ensure_ascii=False)
+    os.replace(tmp_path, CACHE_PATH)
+    _dirty = 0
+
+def _touch_locked():
+    global _dirty
+    _dirty += 1
+    if _dirty >= GRAVAR_A_CADA:
+        _save_locked()
+
+def lookup(url, touch=True):
+    """
+    Retorna (chapter_id, token) do cache ou (None, None). O token mais
+    recente conhecido para o mesmo mangá tem preferência sobre o do capítulo.
+    Com touch=False a consulta não conta como uso da entrada
+    """
+    now = time.time()
+    with _lock:
+        cache = _load()
+        entry = cache['capitulos'].get(url)
+        if not entry or now - entry['resolvido'] > TTL_CAPITULO:
+            return None, None
+
+        token, token_ts = entry['token'], entry['token_ts']
+        manga = cache['mangas'].get(_manga_key(url))
+        if manga and manga['ts'] > token_ts:
+            token, token_ts = manga['token'], manga['ts']
+        if now - token_ts > TTL_TOKEN:
+            return None, None
+
+        if touch:
+            entry['usado'] = now
+            _touch_locked()
+        return entry['chapter_id'], token
+
+def store(url, chapter_id, token):
+    """
+    Registra o chapter_id e o token obtidos da página do capítulo
+    """
+    now = time.time()
+    with _lock:
+        cache = _load()
+        cache['capitulos'][url] = {
+            'chapter_id': chapter_id,
+            'token': token,
+            'token_ts': now,
+            'resolvido': now,
+            'usado': now
+        }
+        key = _manga_key(url)
+        if key:
+            cache['mangas'][key] = {'token': token, 'ts': now}
+        if len(cache['capitulos']) > MAX_ENTRADAS:
+            _expire(now)
+        _touch_locked()
+
+def invalidate(url):
+    """
+    Descarta o token em cache do capítulo e do seu mangá (falha de autenticação)
+    """
+    with _lock:
+        cache = _load()
+        cache['capitulos'].pop(url, None)
+        cache['mangas'].pop(_manga_key(url), None)
+        _touch_locked()
+
+def save():
+    """
+    Grava as alterações pendentes do cache em disco
+    """
+    with _lock:
+        _save_locked()
+
+atexit.register(save)
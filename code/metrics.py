@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+# Limites (em segundos) dos baldes dos histogramas de latência
+BALDES_LATENCIA = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Endereço padrão do /metrics: só a própria máquina
+ENDERECO_PROMETHEUS = '127.0.0.1'
+
+_lock = threading.Lock()
+_started = time.time()
+_counters = {}
+_histograms = {}
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def inc(name, value=1, **labels):
+    """
+    Soma value ao contador name (com os rótulos informados)
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, value, **labels):
+    """
+    Registra uma observação (em segundos) no histograma name
+    """
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = {'buckets': [0] * len(BALDES_LATENCIA), 'count': 0, 'sum': 0.0, 'max': 0.0}
+            _histograms[key] = histogram
+        for index, bound in enumerate(BALDES_LATENCIA):
+            if value <= bound:
+                histogram['buckets'][index] += 1
+        histogram['count'] += 1
+        histogram['sum'] += value
+        histogram['max'] = max(histogram['max'], value)
+
+@contextmanager
+def timed(name, **labels):
+    """
+    Mede a duração do bloco e registra no histograma name
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+def endpoint_name(url):
+    """
+    Nome curto do endpoint para uso como rótulo (ex.: capitulos_info.php, imagem)
+    """
+    path = urlparse(url).path
+    basename = os.path.basename(path.rstrip('/'))
+    if basename.endswith('.php'):
+        return basename
+    if basename.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.gif')):
+        return 'imagem'
+    return 'pagina'
+
+def record_response(url, response, elapsed):
+    """
+    Registra latência, status e retentativas de uma resposta HTTP
+    """
+    endpoint = endpoint_name(url)
+    observe('sakura_request_seconds', elapsed, endpoint=endpoint)
+    inc('sakura_requests_total', endpoint=endpoint, status=str(response.status_code))
+    retries = getattr(getattr(response, 'raw', None), 'retries', None)
+    history = getattr(retries, 'history', None) or ()
+    if history:
+        inc('sakura_retries_total', len(history), endpoint=endpoint)
+
+def snapshot():
+    """
+    Retorna todas as métricas em um dicionário serializável em JSON
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: dict(value, buckets=list(value['buckets'])) for key, value in _histograms.items()}
+    uptime = time.time() - _started
+
+    def label_text(labels):
+        return ','.join(f'{name}={value}' for name, value in labels)
+
+    data = {'duracao_s': round(uptime, 3), 'contadores': {}, 'histogramas': {}}
+    for (name, labels), value in sorted(counters.items()):
+        data['contadores'].setdefault(name, {})[label_text(labels)] = value
+    for (name, labels), histogram in sorted(histograms.items()):
+        count = histogram['count']
+        data['histogramas'].setdefault(name, {})[label_text(labels)] = {
+            'quantidade': count,
+            'soma_s': round(histogram['sum'], 4),
+            'media_s': round(histogram['sum'] / count, 4) if count else 0,
+            'max_s': round(histogram['max'], 4),
+            'baldes': dict(zip([str(bound) for bound in BALDES_LATENCIA], histogram['buckets'])),
+        }
+
+    total_bytes = sum(data['contadores'].get('sakura_bytes_total', {}).values())
+    data['bytes_por_segundo'] = round(total_bytes / uptime, 1) if uptime else 0
+    return data
+
+def dump_json(path):
+    """
+    Grava o snapshot das métricas em um arquivo JSON
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot(), f, ensure_ascii=False, indent=4)
+    print(f"Métricas salvas em {path}")
+
+def _prometheus_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in items) + '}'
+
+def render_prometheus():
+    """
+    Métricas no formato texto do Prometheus
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: dict(value, buckets=list(value['buckets'])) for key, value in _histograms.items()}
+
+    lines = []
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            lines.append(f'# TYPE {name} counter')
+            seen.add(name)
+        lines.append(f'{name}{_prometheus_labels(labels)} {value}')
+    for (name, labels), histogram in sorted(histograms.items()):
+        if name not in seen:
+            lines.append(f'# TYPE {name} histogram')
+            seen.add(name)
+        for bound, count in zip(BALDES_LATENCIA, histogram['buckets']):
+            lines.append(f'{name}_bucket{_prometheus_labels(labels, [("le", bound)])} {count}')
+        lines.append(f'{name}_bucket{_prometheus_labels(labels, [("le", "+Inf")])} {histogram["count"]}')
+        lines.append(f'{name}_sum{_prometheus_labels(labels)} {histogram["sum"]}')
+        lines.append(f'{name}_count{_prometheus_labels(labels)} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
+
+def write_prometheus(path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+def start_prometheus_file(path, interval=15):
+    """
+    Regrava o arquivo de métricas do Prometheus periodicamente (para o
+    textfile collector do node_exporter, por exemplo)
+    """
+    def loop():
+        while True:
+            try:
+                write_prometheus(path)
+            except OSError as e:
+                print(f"Erro ao gravar métricas em {path}: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=loop, daemon=True).start()
+
+def start_prometheus_server(port, host=ENDERECO_PROMETHEUS):
+    """
+    Expõe /metrics em uma thread separada, por padrão só na própria máquina
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            body = render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Métricas do Prometheus em http://{host}:{port}/metrics")
+    return server
+
+def add_arguments(parser):
+    """
+    Adiciona as opções de métricas a um ArgumentParser
+    """
+    parser.add_argument('--metricas', help="Grava as métricas da execução neste arquivo JSON ao final")
+    parser.add_argument('--prometheus-arquivo', help="Mantém as métricas no formato do Prometheus neste arquivo")
+    parser.add_argument('--prometheus-porta', type=int, help="Expõe /metrics do Prometheus nesta porta")
+    parser.add_argument('--prometheus-endereco', default=ENDERECO_PROMETHEUS,
+                        help="Endereço em que /metrics escuta (0.0.0.0 expõe em todas as interfaces)")
+
+def start(args):
+    """
+    Inicia as saídas de métricas pedidas na linha de comando
+    """
+    if args.prometheus_arquivo:
+        start_prometheus_file(args.prometheus_arquivo)
+    if args.prometheus_porta:
+        start_prometheus_server(args.prometheus_porta, args.prometheus_endereco)
+
+def finish(args):
+    """
+    Grava as métricas finais pedidas na linha de comando
+    """
+    if args.metricas:
+        dump_json(args.metricas)
+    if args.prometheus_arquivo:
+        write_prometheus(args.prometheus_arquivo)
@@ -0,0 +1,153 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Requisições por segundo permitidas contra o site (todas as threads somadas, 0 = sem limite)
+REQUISICOES_POR_SEGUNDO = 4.0
+# Quantidade de requisições que podem sair em rajada após um período ocioso
+RAJADA = 4
+# Máximo de bytes de imagens mantidos em memória ao mesmo tempo pelo processo
+MAX_BYTES_EM_MEMORIA = 8 * 1024 * 1024
+# Bytes de imagens por segundo somando todos os downloads (0 = sem limite)
+BYTES_POR_SEGUNDO = 0
+
+class TokenBucket:
+    """
+    Balde de fichas thread-safe: cada requisição consome uma ficha e as
+    fichas são repostas a uma taxa fixa por segundo. Taxa 0 desliga o limite
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        """
+        Bloqueia até haver fichas disponíveis e retorna o tempo esperado
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                if self.rate <= 0:
+                    return waited
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def set_rate(self, rate, capacity=None):
+        """
+        Altera a taxa de reposição sem perder as fichas acumuladas
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+            if capacity is not None:
+                self.capacity = float(capacity)
+            self.tokens = min(self.tokens, self.capacity)
+
+class ByteBudget:
+    """
+    Teto de bytes em uso ao mesmo tempo, compartilhado entre as threads
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size):
+        # Um pedido maior que o teto é limitado a ele para não travar
+        size = min(size, self.limit)
+        with self.condition:
+            while self.in_use + size > self.limit:
+                self.condition.wait()
+            self.in_use += size
+        return size
+
+    def release(self, size):
+        with self.condition:
+            self.in_use -= size
+            self.condition.notify_all()
+
+    @contextmanager
+    def reserve(self, size):
+        size = self.acquire(size)
+        try:
+            yield
+        finally:
+            self.release(size)
+
+_limiter = TokenBucket(REQUISICOES_POR_SEGUNDO, RAJADA)
+_memory_budget = ByteBudget(MAX_BYTES_EM_MEMORIA)
+_bandwidth = None
+
+def get_limiter():
+    """
+    Retorna o limitador global de requisições
+    """
+    return _limiter
+
+def configure(rate, capacity=None):
+    """
+    Ajusta o limitador global de requisições por segundo
+    """
+    _limiter.set_rate(rate, capacity)
+    return _limiter
+
+def get_memory_budget():
+    """
+    Retorna o teto global de bytes em memória
+    """
+    return _memory_budget
+
+def configure_memory(limit):
+    """
+    Ajusta o teto global de bytes em memória
+    """
+    with _memory_budget.condition:
+        _memory_budget.limit = max(1, int(limit))
+        _memory_budget.condition.notify_all()
+    return _memory_budget
+
+def get_bandwidth_limiter():
+    """
+    Retorna o limitador global de bytes por segundo, ou None se desligado
+    """
+    return _bandwidth
+
+def configure_bandwidth(rate):
+    """
+    Ajusta o limite global de bytes por segundo das imagens (0 desliga).
+    O balde comporta um segundo de transferência
+    """
+    global _bandwidth, BYTES_POR_SEGUNDO
+    BYTES_POR_SEGUNDO = max(0, rate)
+    _bandwidth = TokenBucket(BYTES_POR_SEGUNDO, BYTES_POR_SEGUNDO) if BYTES_POR_SEGUNDO else None
+    return _bandwidth
+
+def consume_bandwidth(size):
+    """
+    Desconta size bytes do limite de banda, esperando se necessário.
+    Retorna o tempo esperado
+    """
+    bandwidth = _bandwidth
+    waited = 0.0
+    if bandwidth is None:
+        return waited
+    # Um bloco maior que o balde é descontado em partes para não travar
+    while size > 0:
+        part = min(size, bandwidth.capacity)
+        waited += bandwidth.acquire(part)
+        size -= part
+    return waited
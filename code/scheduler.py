@@ -0,0 +1,235 @@
+import os
+import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Número de capítulos processados ao mesmo tempo
+CAPITULOS_SIMULTANEOS = 3
+# Capítulos com metadados resolvidos à frente dos que estão baixando imagens
+CAPITULOS_ADIANTADOS = 3
+# Como escolher entre as scans de um mesmo capítulo: 'recente' (upload mais
+# novo), 'primeira' (upload mais antigo) ou 'preferidas' (ordem de SCANS_PREFERIDAS)
+POLITICAS_SCAN = ('recente', 'primeira', 'preferidas')
+POLITICA_SCAN = 'recente'
+SCANS_PREFERIDAS = []
+
+def configure_selection(policy=POLITICA_SCAN, preferred=None):
+    """
+    Define a política de escolha de scan e a lista de scans preferidas
+    """
+    global POLITICA_SCAN, SCANS_PREFERIDAS
+    if policy not in POLITICAS_SCAN:
+        raise ValueError(f"Política de scan desconhecida: {policy}")
+    POLITICA_SCAN = policy
+    SCANS_PREFERIDAS = [name.strip() for name in (preferred or []) if name.strip()]
+
+def jobs_from_json(json_file_path):
+    """
+    Lê um links_caps.json e retorna seus capítulos como tarefas, do mais
+    antigo para o mais recente
+    """
+    with open(json_file_path, 'r', encoding='utf-8') as f:
+        chapters_data = json.load(f)
+
+    manga_folder = os.path.dirname(os.path.abspath(json_file_path))
+    return jobs_from_chapters(chapters_data, manga_folder, json_file_path)
+
+def jobs_from_chapters(chapters_data, manga_folder=None, source=None):
+    """
+    Converte entradas no formato do links_caps.json em tarefas, do mais
+    antigo para o mais recente
+    """
+    jobs = []
+    # Processa links em ordem reversa (de baixo para cima)
+    for chapter in reversed(chapters_data):
+        jobs.append({
+            'link': chapter.get('link-capitulo'),
+            'num': chapter.get('num-capitulo'),
+            'title': chapter.get('cap-titulo'),
+            'scan': chapter.get('scan-nome'),
+            'manga_folder': manga_folder,
+            'source': source
+        })
+    return jobs
+
+def _rank_releases(releases, policy, preferred):
+    """
+    Ordena as versões de um capítulo da escolhida para a última alternativa.
+    releases é uma lista de (posição, tarefa) na ordem da fila; como a fila é
+    a lista do site invertida, posições maiores são uploads mais recentes
+    """
+    if policy == 'primeira':
+        return sorted(releases, key=lambda item: item[0])
+    newest_first = sorted(releases, key=lambda item: -item[0])
+    if policy == 'preferidas':
+        order = {name.lower(): index for index, name in enumerate(preferred)}
+        return sorted(newest_first, key=lambda item: order.get((item[1].get('scan') or '').lower(), len(order)))
+    return newest_first
+
+def select_releases(jobs, policy=None, preferred=None):
+    """
+    Mantém uma única tarefa por capítulo de cada mangá quando há uploads de
+    várias scans. As demais versões ficam em 'alternatives' e só são usadas
+    se a escolhida falhar
+    """
+    if policy is None:
+        policy = POLITICA_SCAN
+    if preferred is None:
+        preferred = SCANS_PREFERIDAS
+
+    groups = {}
+    order = []
+    for position, job in enumerate(jobs):
+        if job.get('num') is None:
+            order.append(('unico', position))
+            continue
+        key = (job.get('manga_folder') or job.get('source'), str(job['num']))
+        if key not in groups:
+            groups[key] = []
+            order.append(('capitulo', key))
+        groups[key].append((position, job))
+
+    selected = []
+    for kind, value in order:
+        if kind == 'unico':
+            selected.append(jobs[value])
+            continue
+        releases = groups[value]
+        if len(releases) == 1:
+            selected.append(releases[0][1])
+            continue
+        ranked = [job for _, job in _rank_releases(releases, policy, preferred)]
+        chosen = dict(ranked[0], alternatives=ranked[1:])
+        selected.append(chosen)
+
+    duplicates = len(jobs) - len(selected)
+    if duplicates:
+        print(f"{duplicates} upload(s) repetido(s) de outras scans deixado(s) como alternativa")
+    return selected
+
+def collect_jobs(inputs):
+    """
+    Junta em uma única fila os capítulos de todas as entradas (arquivos
+    JSON, links diretos ou tarefas já montadas), com uma única versão por
+    capítulo
+    """
+    jobs = []
+    for arg in inputs:
+        if isinstance(arg, dict):
+            jobs.append(arg)
+        elif arg.lower().endswith('.json'):
+            try:
+                jobs.extend(jobs_from_json(arg))
+            except Exception as e:
+                print(f"Erro ao processar arquivo JSON {arg}: {e}")
+        elif arg.startswith('http'):
+            jobs.append({'link': arg, 'num': None, 'title': None, 'scan': None,
+                         'manga_folder': None, 'source': arg})
+        else:
+            print(f"Argumento não reconhecido: {arg}")
+    return select_releases(jobs)
+
+def add_arguments(parser):
+    """
+    Adiciona as opções da fila (escolha de scan e adiantamento) a um ArgumentParser
+    """
+    parser.add_argument('--adiantar', type=int, default=CAPITULOS_ADIANTADOS,
+                        help="Capítulos com metadados resolvidos enquanto as imagens dos atuais são baixadas")
+    parser.add_argument('--scan-politica', choices=POLITICAS_SCAN,
+                        help="Qual upload baixar quando um capítulo tem mais de uma scan (padrão: recente)")
+    parser.add_argument('--scans', default='',
+                        help="Scans preferidas, em ordem, separadas por vírgula (usa a política 'preferidas')")
+
+def configure_from_args(args):
+    """
+    Aplica as opções da fila da linha de comando
+    """
+    global CAPITULOS_ADIANTADOS
+    CAPITULOS_ADIANTADOS = max(1, args.adiantar)
+    preferred = args.scans.split(',') if args.scans else []
+    policy = args.scan_politica or ('preferidas' if preferred else POLITICA_SCAN)
+    configure_selection(policy, preferred)
+
+def run_jobs(jobs, worker, max_workers=CAPITULOS_SIMULTANEOS):
+    """
+    Executa worker(job) para cada tarefa com até max_workers capítulos em
+    paralelo e retorna (sucessos, falhas)
+    """
+    succeeded = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(worker, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                ok = future.result()
+            except Exception as e:
+                print(f"Erro ao processar {job.get('link')}: {e}")
+                ok = False
+            if ok:
+                succeeded += 1
+            else:
+                failed += 1
+    return succeeded, failed
+
+def prefetch(items, func, ahead=CAPITULOS_ADIANTADOS):
+    """
+    Gera func(item) para cada item, na ordem, mantendo até ahead chamadas
+    em andamento à frente de quem consome. Como só avança quando o próximo
+    resultado é pedido, um consumidor lento segura a etapa anterior
+    """
+    ahead = max(1, ahead)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=ahead) as executor:
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= ahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def run_pipeline(jobs, resolve, transfer, max_workers=CAPITULOS_SIMULTANEOS, ahead=CAPITULOS_ADIANTADOS):
+    """
+    Executa cada tarefa em duas etapas: resolve(job), adiantada em até ahead
+    tarefas, e transfer(job, resolvido), com até max_workers em paralelo.
+    Se resolve retornar um bool, ele já é o resultado da tarefa. Retorna
+    (sucessos, falhas)
+    """
+    def safe_resolve(job):
+        try:
+            return job, resolve(job)
+        except Exception as e:
+            print(f"Erro ao processar {job.get('link')}: {e}")
+            return job, False
+
+    succeeded = 0
+    failed = 0
+    # Só pede a próxima resolução quando há vaga para transferir
+    slots = threading.Semaphore(max(1, max_workers))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {}
+        for job, resolved in prefetch(jobs, safe_resolve, ahead):
+            if isinstance(resolved, bool):
+                if resolved:
+                    succeeded += 1
+                else:
+                    failed += 1
+                continue
+            slots.acquire()
+            future = executor.submit(transfer, job, resolved)
+            future.add_done_callback(lambda _: slots.release())
+            futures[future] = job
+
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                ok = future.result()
+            except Exception as e:
+                print(f"Erro ao processar {job.get('link')}: {e}")
+                ok = False
+            if ok:
+                succeeded += 1
+            else:
+                failed += 1
+    return succeeded, failed
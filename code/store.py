@@ -0,0 +1,62 @@
+import os
+import shutil
+
+STORE_DIR = os.path.join('mangas', '.store')
+
+# ioctl do Linux que cria uma cópia por referência (reflink) em btrfs/xfs
+FICLONE = 0x40049409
+
+def blob_path(sha256):
+    """
+    Caminho do blob de uma página no armazenamento por conteúdo
+    """
+    return os.path.join(STORE_DIR, sha256[:2], sha256)
+
+def has_blob(sha256):
+    return bool(sha256) and os.path.exists(blob_path(sha256))
+
+def _reflink(src, dst):
+    import fcntl
+    with open(src, 'rb') as source, open(dst, 'wb') as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+
+def place(sha256, dest):
+    """
+    Coloca o blob no caminho dest como hardlink; se não for possível, tenta
+    reflink e, por último, uma cópia comum
+    """
+    src = blob_path(sha256)
+    tmp_path = dest + '.link'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        try:
+            _reflink(src, tmp_path)
+        except (OSError, ImportError):
+            shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dest)
+
+def ingest(path, sha256):
+    """
+    Adiciona uma página recém-baixada ao armazenamento. Se o conteúdo já
+    existia, a página vira um link para o blob existente. Retorna True se a
+    página era duplicada
+    """
+    blob = blob_path(sha256)
+    if os.path.exists(blob):
+        if not os.path.samefile(blob, path):
+            place(sha256, path)
+        return True
+
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    try:
+        os.link(path, blob)
+    except FileExistsError:
+        # Outra thread guardou o mesmo conteúdo ao mesmo tempo
+        place(sha256, path)
+        return True
+    except OSError:
+        shutil.copyfile(path, blob)
+    return False
@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+import mmap
+import hashlib
+import zipfile
+import argparse
+import cap
+import cbz
+import library
+import manifest
+import metrics
+import scheduler
+import store
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+# Capítulos entregues de uma vez a cada processo de verificação
+CAPITULOS_POR_LOTE = 8
+
+# Motivos pelos quais uma página precisa ser baixada de novo
+MOTIVO_FALTANDO = 'faltando'
+MOTIVO_VAZIA = 'vazia'
+MOTIVO_TRUNCADA = 'truncada'
+MOTIVO_MARCADOR = 'sem marcador de fim'
+MOTIVO_HASH = 'hash diferente'
+
+def find_chapters(root):
+    """
+    Pastas de capítulo (com capitulo_pages.json) abaixo de root, em ordem.
+    Pastas ocultas (.store, .cache) são ignoradas
+    """
+    folders = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if 'capitulo_pages.json' in filenames:
+            folders.append(dirpath)
+            # Não desce em pages/: pode ter milhares de arquivos
+            dirnames[:] = []
+            continue
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+    return folders
+
+def _image_urls(chapter_folder):
+    try:
+        with open(os.path.join(chapter_folder, 'capitulo_pages.json'), 'r', encoding='utf-8') as f:
+            return json.load(f).get('imageUrls') or []
+    except (OSError, ValueError):
+        return []
+
+def check_page(path, entry, check_hash=False):
+    """
+    Verifica uma página lendo o arquivo por mmap: existência, tamanho
+    registrado no manifesto, marcador de fim do formato e, opcionalmente,
+    o sha256. Retorna o motivo do problema ou None
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return MOTIVO_FALTANDO
+    if size == 0:
+        return MOTIVO_VAZIA
+    if entry and entry.get('size') is not None and entry['size'] != size:
+        return MOTIVO_TRUNCADA
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if not manifest.has_end_marker(path, data[:12], data[-16:], size):
+                return MOTIVO_MARCADOR
+            if check_hash and entry and entry.get('sha256'):
+                if hashlib.sha256(data).hexdigest() != entry['sha256']:
+                    return MOTIVO_HASH
+    except (OSError, ValueError):
+        return MOTIVO_FALTANDO
+    return None
+
+def _check_archive(path, page_count):
+    """
+    Confere o CRC de todas as entradas do CBZ e se ele tem todas as páginas.
+    Retorna o motivo do problema ou None
+    """
+    try:
+        with zipfile.ZipFile(path) as archive:
+            bad = archive.testzip()
+            pages = [name for name in archive.namelist() if name != cbz.COMIC_INFO_NAME]
+    except (OSError, zipfile.BadZipFile) as e:
+        return f"CBZ ilegível ({e})"
+    if bad:
+        return f"CBZ com entrada corrompida ({bad})"
+    if len(pages) < page_count:
+        return f"CBZ com {len(pages)} de {page_count} página(s)"
+    return None
+
+def check_chapter(chapter_folder, check_hash=False):
+    """
+    Verifica as páginas de um capítulo contra o capitulo_pages.json e o
+    manifesto. Roda em um processo separado. Retorna um dicionário com as
+    páginas ruins [(arquivo, motivo)] e o problema do CBZ, se houver
+    """
+    image_urls = _image_urls(chapter_folder)
+    data = manifest.load(chapter_folder)
+    pages_folder = os.path.join(chapter_folder, 'pages')
+    archive_path = cbz.cbz_path(chapter_folder)
+    has_archive = os.path.exists(archive_path)
+    # Capítulo só em CBZ: as páginas soltas não foram mantidas
+    has_pages = os.path.isdir(pages_folder) and bool(os.listdir(pages_folder))
+
+    bad_pages = []
+    if has_pages or not has_archive:
+        for img_url in image_urls:
+            filename = os.path.basename(img_url)
+            entry = data['pages'].get(filename)
+            reason = check_page(manifest.page_path(pages_folder, filename, entry), entry, check_hash)
+            if reason:
+                bad_pages.append((filename, reason))
+
+    return {
+        'pasta': chapter_folder,
+        'paginas': len(image_urls),
+        'ruins': bad_pages,
+        'cbz': _check_archive(archive_path, len(image_urls)) if has_archive else None,
+        'soltas': has_pages,
+    }
+
+def _check_chapter_with_hash(chapter_folder):
+    return check_chapter(chapter_folder, check_hash=True)
+
+def verify_library(root, workers=None, check_hash=False):
+    """
+    Verifica todos os capítulos abaixo de root em um pool com um processo
+    por núcleo. Retorna os resultados dos capítulos com problema
+    """
+    folders = find_chapters(root)
+    print(f"Verificando {len(folders)} capítulo(s) em {root}...")
+    worker = _check_chapter_with_hash if check_hash else check_chapter
+    broken = []
+    checked_pages = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for result in executor.map(worker, folders, chunksize=CAPITULOS_POR_LOTE):
+            checked_pages += result['paginas']
+            if result['ruins'] or result['cbz']:
+                broken.append(result)
+                print(f"\n{result['pasta']}:")
+                for filename, reason in result['ruins']:
+                    print(f"  {filename}: {reason}")
+                if result['cbz']:
+                    print(f"  {result['cbz']}")
+
+    bad_pages = sum(len(result['ruins']) for result in broken)
+    print(f"\n{len(folders)} capítulo(s) e {checked_pages} página(s) verificados: "
+          f"{bad_pages} página(s) com problema em {len(broken)} capítulo(s)")
+    metrics.inc('sakura_verify_pages_total', checked_pages)
+    metrics.inc('sakura_verify_bad_pages_total', bad_pages)
+    return broken
+
+def _discard_bad_pages(chapter_folder, bad_pages):
+    """
+    Remove as páginas ruins e as suas entradas do manifesto, para que só
+    elas sejam baixadas de novo. Um blob do armazenamento ligado a uma página
+    ruim também sai, senão a página voltaria a ser ligada ao mesmo conteúdo
+    """
+    data = manifest.load(chapter_folder)
+    pages_folder = os.path.join(chapter_folder, 'pages')
+    for filename, _ in bad_pages:
+        entry = data['pages'].pop(filename, None)
+        paths = {manifest.page_path(pages_folder, filename, entry), os.path.join(pages_folder, filename)}
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            sha256 = entry.get('sha256') if entry else None
+            if store.has_blob(sha256) and os.path.samefile(store.blob_path(sha256), path):
+                os.remove(store.blob_path(sha256))
+            os.remove(path)
+    data['complete'] = False
+    manifest.save(chapter_folder, data)
+
+def repair_chapter(result):
+    """
+    Baixa de novo só as páginas ruins de um capítulo e refaz o CBZ, se
+    existir. Um CBZ sem páginas soltas é baixado inteiro. Retorna True se
+    o capítulo ficou completo
+    """
+    chapter_folder = result['pasta']
+    image_urls = _image_urls(chapter_folder)
+    if not image_urls:
+        print(f"Sem imageUrls em {chapter_folder}, use o cap.py para baixar o capítulo de novo")
+        return False
+
+    _discard_bad_pages(chapter_folder, result['ruins'])
+    print(f"Reparando {chapter_folder}...")
+    rebuild = result['cbz'] or (result['ruins'] and os.path.exists(cbz.cbz_path(chapter_folder)))
+    archive = cbz.CbzWriter(chapter_folder) if rebuild else None
+    complete = False
+    try:
+        complete = cap.download_images(image_urls, chapter_folder, archive=archive,
+                                       keep_pages=result['soltas'] or archive is None)
+    finally:
+        if archive is not None:
+            archive.close(complete)
+    try:
+        status = library.STATUS_COMPLETO if complete else library.STATUS_FALHOU
+        if not library.set_folder_status(chapter_folder, status):
+            print(f"{chapter_folder} não está no índice da biblioteca (rode o verify.py da pasta do download)")
+    except Exception as e:
+        print(f"Erro ao atualizar o índice da biblioteca: {e}")
+    return complete
+
+def repair(broken, max_chapters=scheduler.CAPITULOS_SIMULTANEOS):
+    """
+    Repara os capítulos com problema, vários ao mesmo tempo.
+    Retorna (sucessos, falhas)
+    """
+    succeeded = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_chapters)) as executor:
+        futures = {executor.submit(repair_chapter, result): result for result in broken}
+        for future in as_completed(futures):
+            try:
+                ok = future.result()
+            except Exception as e:
+                print(f"Erro ao reparar {futures[future]['pasta']}: {e}")
+                ok = False
+            if ok:
+                succeeded += 1
+            else:
+                failed += 1
+    return succeeded, failed
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Sakura Mangas Downloader - verifica e repara a biblioteca")
+    parser.add_argument('pasta', nargs='?', default='mangas',
+                        help="Pasta da biblioteca (ou de um mangá) a verificar")
+    parser.add_argument('--reparar', action='store_true',
+                        help="Baixa de novo só as páginas com problema")
+    parser.add_argument('--hash', action='store_true',
+                        help="Também confere o sha256 de cada página com o manifesto (lê tudo)")
+    parser.add_argument('--nucleos', type=int, default=None,
+                        help="Processos de verificação (padrão: um por núcleo)")
+    cap.add_download_arguments(parser)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args(sys.argv[1:])
+    if not os.path.isdir(args.pasta):
+        print(f"Pasta não encontrada: {args.pasta}")
+        sys.exit(1)
+    cap.configure_download(args)
+
+    try:
+        broken = verify_library(args.pasta, args.nucleos, args.hash)
+        if broken and args.reparar:
+            succeeded, failed = repair(broken, args.capitulos)
+            print(f"\n{succeeded} capítulo(s) reparado(s), {failed} com falha")
+            if failed:
+                sys.exit(1)
+        elif broken:
+            print("Use --reparar para baixar de novo as páginas com problema")
+            sys.exit(1)
+    finally:
+        metrics.finish(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import os
+import re
+import sys
+import time
+import argparse
+import batch
+import cap
+import library
+import manga
+import metacache
+import metrics
+import scheduler
+from concurrent.futures import ThreadPoolExecutor
+
+# Intervalo padrão entre duas verificações da mesma obra (segundos)
+INTERVALO_PADRAO = 3600
+# Número de obras verificadas ao mesmo tempo
+VERIFICACOES_SIMULTANEAS = 4
+# Espera máxima entre duas passadas pela lista, para notar obras novas nela
+ESPERA_MAXIMA = 60
+
+_UNIDADES = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+def parse_interval(text):
+    """
+    Converte um intervalo como 900, 30m, 2h ou 1d em segundos
+    """
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([smhd]?)', text.strip().lower())
+    if not match:
+        raise ValueError(f"Intervalo inválido: {text}")
+    return float(match.group(1)) * _UNIDADES[match.group(2) or 's']
+
+def load_watchlist(path, default_interval=INTERVALO_PADRAO):
+    """
+    Lê a lista de acompanhamento: uma URL de obra por linha, opcionalmente
+    seguida do intervalo entre verificações (ex.: 'https://.../obras/x/ 6h').
+    Linhas vazias e comentários (#) são ignorados. Retorna [(url, intervalo)]
+    """
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = line.split()
+            url = parts[0]
+            if not batch.is_manga_url(url):
+                print(f"Pulando URL que não é de obra: {url}")
+                continue
+            try:
+                interval = parse_interval(parts[1]) if len(parts) > 1 else default_interval
+            except ValueError as e:
+                print(f"{e} para {url}, usando o padrão")
+                interval = default_interval
+            entries.append((url, interval))
+    return entries
+
+def _resolve(url, state, refresh=False):
+    """
+    manga_id e token da obra a partir do estado guardado ou, se vencido, da
+    página da obra
+    """
+    fresh = state.get('token_ts') and time.time() - state['token_ts'] < metacache.TTL_TOKEN
+    if not refresh and state.get('manga_id') and state.get('token') and fresh:
+        return {'manga_id': state['manga_id'], 'token': state['token']}
+    manga_info = manga.extract_manga_info(url)
+    if manga_info:
+        library.save_watch_state(url, manga_id=manga_info['manga_id'], token=manga_info['token'],
+                                 token_ts=time.time())
+    return manga_info
+
+def check_series(url, interval):
+    """
+    Verifica uma obra com uma única requisição condicional a manga_info.php.
+    Retorna (manga_info, detalhes, validadores) se houver capítulo novo, ou None
+    """
+    state = library.watch_state(url)
+    manga_info = _resolve(url, state)
+    if not manga_info:
+        library.save_watch_state(url, verificado=time.time(), proxima=time.time() + interval)
+        return None
+
+    response_info = {}
+    details = manga.get_manga_details(manga_info['manga_id'], manga_info['token'], state.get('etag'),
+                                      state.get('modificado'), response_info)
+    if response_info['status'] not in (200, 304, None):
+        # Token recusado: busca a página da obra de novo e repete uma vez
+        manga_info = _resolve(url, state, refresh=True)
+        if manga_info:
+            details = manga.get_manga_details(manga_info['manga_id'], manga_info['token'], state.get('etag'),
+                                              state.get('modificado'), response_info)
+
+    status = response_info['status']
+    now = time.time()
+    library.save_watch_state(url, verificado=now, proxima=now + interval)
+    metrics.inc('sakura_watch_checks_total', resultado=str(status))
+    if status == 304:
+        return None
+    if status != 200 or not details:
+        print(f"Falha ao verificar {url}: {status}")
+        return None
+
+    validators = {'etag': response_info['etag'], 'modificado': response_info['modificado']}
+    known = state.get('ultimo_capitulo') or library.manga_last_chapter(manga_info['manga_id'])
+    latest = str(details.get('ultimo_capitulo', ''))
+    if known is not None and str(known) == latest:
+        library.save_watch_state(url, ultimo_capitulo=latest, **validators)
+        return None
+    print(f"{details.get('titulo', url)}: último capítulo {known} -> {latest}")
+    return manga_info, details, validators
+
+def process_series(url, manga_info, details, validators, catalog_only=False,
+                   max_chapters=scheduler.CAPITULOS_SIMULTANEOS):
+    """
+    Atualiza o catálogo de uma obra com capítulo novo e baixa os novos.
+    Retorna (sucessos, falhas)
+    """
+    catalog = manga.fetch_catalog(url, incremental=True, manga_info=manga_info, manga_details=details)
+    if not catalog:
+        return 0, 1
+    # Estado e validadores só avançam depois de o catálogo ter sido gravado,
+    # senão uma falha aqui viraria um 304 na próxima verificação
+    library.save_watch_state(url, ultimo_capitulo=str(details.get('ultimo_capitulo', '')), **validators)
+    if catalog_only or not catalog['new_chapters']:
+        return 0, 0
+
+    jobs = scheduler.jobs_from_chapters(catalog['new_chapters'], catalog['manga_dir'], catalog['links_caps'])
+    print(f"{len(jobs)} capítulo(s) novo(s) de {catalog['titulo']} na fila")
+    return cap.download_chapters(jobs, max_chapters)
+
+def run_cycle(entries, catalog_only=False, max_chapters=scheduler.CAPITULOS_SIMULTANEOS):
+    """
+    Verifica as obras cuja próxima verificação já venceu e processa as que
+    têm capítulo novo. Retorna (verificadas, sucessos, falhas)
+    """
+    now = time.time()
+    due = [(url, interval) for url, interval in entries
+           if (library.watch_state(url).get('proxima') or 0) <= now]
+    if not due:
+        return 0, 0, 0
+
+    with ThreadPoolExecutor(max_workers=VERIFICACOES_SIMULTANEAS) as executor:
+        results = list(executor.map(lambda entry: check_series(*entry), due))
+
+    succeeded = 0
+    failed = 0
+    changed = [(url, result) for (url, _), result in zip(due, results) if result]
+    print(f"{len(due)} obra(s) verificada(s), {len(changed)} com capítulo novo")
+    for url, (manga_info, details, validators) in changed:
+        print(f"\nProcessando URL: {url}")
+        ok, ko = process_series(url, manga_info, details, validators, catalog_only, max_chapters)
+        succeeded += ok
+        failed += ko
+    return len(due), succeeded, failed
+
+def next_due(entries):
+    """
+    Segundos até a próxima verificação vencer
+    """
+    times = [library.watch_state(url).get('proxima') or 0 for url, _ in entries]
+    return max(0.0, min(times) - time.time()) if times else ESPERA_MAXIMA
+
+def watch(path, default_interval=INTERVALO_PADRAO, once=False, catalog_only=False,
+          max_chapters=scheduler.CAPITULOS_SIMULTANEOS):
+    """
+    Acompanha as obras da lista até ser interrompido. A lista é relida a cada
+    passada, então obras podem ser incluídas ou removidas sem reiniciar
+    """
+    while True:
+        entries = load_watchlist(path, default_interval)
+        run_cycle(entries, catalog_only, max_chapters)
+        metacache.save()
+        if once:
+            return
+        time.sleep(max(1, min(ESPERA_MAXIMA, next_due(entries))))
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Sakura Mangas Downloader - acompanha obras e baixa capítulos novos")
+    parser.add_argument('lista', help="Arquivo com uma URL de obra por linha, opcionalmente seguida do intervalo (ex.: 6h)")
+    parser.add_argument('--intervalo', type=parse_interval, default=INTERVALO_PADRAO,
+                        help="Intervalo padrão entre verificações de cada obra (ex.: 900, 30m, 2h)")
+    parser.add_argument('--uma-vez', action='store_true',
+                        help="Faz uma única passada pelas obras vencidas e sai (para uso no cron)")
+    parser.add_argument('--catalogo-apenas', action='store_true',
+                        help="Atualiza manga_info.json e links_caps.json sem baixar capítulos")
+    cap.add_download_arguments(parser)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args(sys.argv[1:])
+    if not os.path.exists(args.lista):
+        print(f"Lista de acompanhamento não encontrada: {args.lista}")
+        sys.exit(1)
+    cap.configure_download(args)
+
+    try:
+        watch(args.lista, args.intervalo, args.uma_vez, args.catalogo_apenas, args.capitulos)
+    except KeyboardInterrupt:
+        print("\nAcompanhamento interrompido")
+    finally:
+        metrics.finish(args)
+
+if __name__ == "__main__":
+    main()
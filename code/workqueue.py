@@ -0,0 +1,378 @@
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+import cap
+import metrics
+import scheduler
+
+# Fila compartilhada de capítulos: vários processos, na mesma máquina ou em
+# máquinas diferentes com o banco da fila em um sistema de arquivos
+# compartilhado, pegam capítulos com concessões (leases) de tempo limitado.
+# Só a fila é segura em rede: biblioteca.db (WAL) e o cache de resolução
+# devem ficar em um mangas/ local de cada máquina
+
+FILA_PATH = os.path.join('mangas', 'fila.db')
+# Duração de uma concessão sem renovação (segundos)
+DURACAO_CONCESSAO = 300
+# Tentativas de um capítulo antes de ficar como falhou
+TENTATIVAS_MAXIMAS = 3
+# Espera entre consultas quando só restam capítulos com outros processos
+ESPERA_FILA = 5
+
+STATUS_PENDENTE = 'pendente'
+STATUS_EM_ANDAMENTO = 'em_andamento'
+STATUS_CONCLUIDO = 'concluido'
+STATUS_FALHOU = 'falhou'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    link TEXT NOT NULL UNIQUE,
+    job TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pendente',
+    worker TEXT,
+    concessao_ate REAL,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    atualizado REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, concessao_ate);
+'''
+
+def worker_name():
+    """
+    Identificação deste processo nas concessões (máquina:pid)
+    """
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+class WorkQueue:
+    """
+    Fila de capítulos em um banco SQLite. Usa o journal clássico (e não WAL)
+    para funcionar também em sistemas de arquivos de rede
+    """
+    def __init__(self, path=FILA_PATH):
+        self.path = path
+        self.local = threading.local()
+
+    def connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=DELETE')
+            conn.executescript(SCHEMA)
+            self.local.conn = conn
+        return conn
+
+    def _write(self, statements):
+        """
+        Executa statements(conn) em uma transação com trava de escrita
+        """
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = statements(conn)
+            conn.execute('COMMIT')
+            return result
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def add(self, jobs):
+        """
+        Adiciona tarefas do scheduler à fila; links já presentes são
+        ignorados. Retorna quantas entraram
+        """
+        now = time.time()
+        rows = [(job['link'], json.dumps(job, ensure_ascii=False), now) for job in jobs if job.get('link')]
+
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany('INSERT OR IGNORE INTO jobs (link, job, atualizado) VALUES (?, ?, ?)', rows)
+            return conn.total_changes - before
+
+        return self._write(insert)
+
+    def claim(self, worker, lease=DURACAO_CONCESSAO, limit=1):
+        """
+        Concede até limit capítulos pendentes (ou com concessão vencida de
+        um processo que morreu) ao worker. Retorna a lista de tarefas, cada
+        uma com o seu 'fila_id'
+        """
+        now = time.time()
+
+        def take(conn):
+            # Concessões vencidas na última tentativa não voltam mais para a fila
+            conn.execute('''
+                UPDATE jobs SET status = ?, worker = NULL, concessao_ate = NULL
+                WHERE status = ? AND concessao_ate < ? AND tentativas >= ?
+            ''', (STATUS_FALHOU, STATUS_EM_ANDAMENTO, now, TENTATIVAS_MAXIMAS))
+            rows = conn.execute('''
+                SELECT id, job FROM jobs
+                WHERE (status = ? OR (status = ? AND concessao_ate < ?)) AND tentativas < ?
+                ORDER BY id LIMIT ?
+            ''', (STATUS_PENDENTE, STATUS_EM_ANDAMENTO, now, TENTATIVAS_MAXIMAS, limit)).fetchall()
+            conn.executemany('''
+                UPDATE jobs SET status = ?, worker = ?, concessao_ate = ?, tentativas = tentativas + 1,
+                    atualizado = ?
+                WHERE id = ?
+            ''', [(STATUS_EM_ANDAMENTO, worker, now + lease, now, row['id']) for row in rows])
+            return rows
+
+        jobs = []
+        for row in self._write(take):
+            job = json.loads(row['job'])
+            job['fila_id'] = row['id']
+            jobs.append(job)
+        return jobs
+
+    def renew(self, ids, worker, lease=DURACAO_CONCESSAO):
+        """
+        Renova as concessões do worker. Retorna os ids que ainda eram dele
+        """
+        if not ids:
+            return []
+        now = time.time()
+
+        def update(conn):
+            renewed = []
+            for job_id in ids:
+                cursor = conn.execute('''
+                    UPDATE jobs SET concessao_ate = ?, atualizado = ?
+                    WHERE id = ? AND worker = ? AND status = ?
+                ''', (now + lease, now, job_id, worker, STATUS_EM_ANDAMENTO))
+                if cursor.rowcount:
+                    renewed.append(job_id)
+            return renewed
+
+        return self._write(update)
+
+    def finish(self, job_id, worker, ok):
+        """
+        Marca o capítulo como concluído ou, em caso de falha, devolve à fila
+        enquanto houver tentativas. Só vale enquanto a concessão for do
+        worker: quem a perdeu não altera o resultado do novo dono. Retorna
+        True se o resultado foi gravado
+        """
+        now = time.time()
+
+        def update(conn):
+            cursor = conn.execute('''
+                UPDATE jobs SET
+                    status = CASE WHEN ? THEN ? WHEN tentativas < ? THEN ? ELSE ? END,
+                    worker = NULL, concessao_ate = NULL, atualizado = ?
+                WHERE id = ? AND worker = ? AND status = ?
+            ''', (ok, STATUS_CONCLUIDO, TENTATIVAS_MAXIMAS, STATUS_PENDENTE, STATUS_FALHOU, now,
+                  job_id, worker, STATUS_EM_ANDAMENTO))
+            return cursor.rowcount > 0
+
+        return self._write(update)
+
+    def counts(self):
+        """
+        Quantidade de capítulos por status; concessões vencidas contam como
+        pendentes
+        """
+        rows = self.connect().execute('''
+            SELECT CASE WHEN status = ? AND concessao_ate < ? THEN ? ELSE status END AS status,
+                   COUNT(*) AS total
+            FROM jobs GROUP BY 1
+        ''', (STATUS_EM_ANDAMENTO, time.time(), STATUS_PENDENTE)).fetchall()
+        return {row['status']: row['total'] for row in rows}
+
+    def retry_failed(self):
+        """
+        Devolve à fila os capítulos que esgotaram as tentativas
+        """
+        def update(conn):
+            before = conn.total_changes
+            conn.execute('UPDATE jobs SET status = ?, tentativas = 0 WHERE status = ?',
+                         (STATUS_PENDENTE, STATUS_FALHOU))
+            return conn.total_changes - before
+
+        return self._write(update)
+
+class LeaseKeeper:
+    """
+    Renova periodicamente as concessões em uso por este processo e lembra
+    das que foram perdidas para outro processo
+    """
+    def __init__(self, work_queue, worker, lease=DURACAO_CONCESSAO):
+        self.work_queue = work_queue
+        self.worker = worker
+        self.lease = lease
+        self.held = set()
+        self.lost = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+
+    def add(self, job_id):
+        with self.lock:
+            self.held.add(job_id)
+
+    def remove(self, job_id):
+        with self.lock:
+            self.held.discard(job_id)
+            self.lost.discard(job_id)
+
+    def owns(self, job_id):
+        """
+        Confere na fila, na hora, se a concessão ainda é deste processo
+        (renovando-a). Uma concessão perdida não volta
+        """
+        with self.lock:
+            if job_id in self.lost:
+                return False
+        if self.work_queue.renew([job_id], self.worker, self.lease):
+            return True
+        with self.lock:
+            self.lost.add(job_id)
+        return False
+
+    def _loop(self):
+        while not self.stopped.wait(max(1, self.lease / 3)):
+            with self.lock:
+                ids = list(self.held)
+            try:
+                renewed = self.work_queue.renew(ids, self.worker, self.lease)
+            except sqlite3.Error as e:
+                print(f"Erro ao renovar concessões: {e}")
+                continue
+            lost = set(ids) - set(renewed)
+            if lost:
+                print(f"{len(lost)} concessão(ões) perdida(s) para outro processo")
+                with self.lock:
+                    self.lost |= lost & self.held
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+def claimed_jobs(work_queue, worker, keeper, lease=DURACAO_CONCESSAO):
+    """
+    Gera capítulos concedidos a este worker, um de cada vez, conforme o
+    pipeline pede. Termina quando não há nada para conceder no momento
+    """
+    while True:
+        jobs = work_queue.claim(worker, lease)
+        if not jobs:
+            return
+        keeper.add(jobs[0]['fila_id'])
+        metrics.inc('sakura_queue_claims_total')
+        yield jobs[0]
+
+def run_worker(work_queue, max_chapters=scheduler.CAPITULOS_SIMULTANEOS, lease=DURACAO_CONCESSAO):
+    """
+    Consome a fila com o mesmo pipeline de cap.download_chapters até não
+    restar nada pendente nem em andamento em outros processos (cujas
+    concessões podem vencer). Retorna (sucessos, falhas)
+    """
+    worker = worker_name()
+    keeper = LeaseKeeper(work_queue, worker, lease)
+    keeper.start()
+
+    def done(job, ok):
+        keeper.remove(job['fila_id'])
+        if not work_queue.finish(job['fila_id'], worker, ok):
+            print(f"Concessão de {job.get('link')} já era de outro processo, resultado descartado")
+        return ok
+
+    def resolve(job):
+        try:
+            resolved = cap.resolve_job(job)
+        except Exception:
+            done(job, False)
+            raise
+        if isinstance(resolved, bool):
+            return done(job, resolved)
+        return resolved
+
+    def transfer(job, resolved):
+        # A concessão pode ter vencido enquanto o capítulo esperava vaga:
+        # o novo dono baixa, este processo pula
+        if not keeper.owns(job['fila_id']):
+            print(f"Concessão de {job.get('link')} perdida, pulando a transferência")
+            keeper.remove(job['fila_id'])
+            return False
+        ok = False
+        try:
+            ok = cap.transfer_job(job, resolved)
+        finally:
+            done(job, ok)
+        return ok
+
+    print(f"Worker {worker} usando a fila {work_queue.path}")
+    succeeded = 0
+    failed = 0
+    try:
+        while True:
+            ok, ko = scheduler.run_pipeline(claimed_jobs(work_queue, worker, keeper, lease),
+                                            resolve, transfer, max_chapters, scheduler.CAPITULOS_ADIANTADOS)
+            succeeded += ok
+            failed += ko
+            counts = work_queue.counts()
+            if not counts.get(STATUS_PENDENTE) and not counts.get(STATUS_EM_ANDAMENTO):
+                break
+            # Outros processos ainda trabalham; se algum morrer, a concessão vence
+            time.sleep(ESPERA_FILA)
+    finally:
+        keeper.stop()
+    print(f"\n{succeeded} capítulo(s) baixado(s), {failed} falha(s) por este worker")
+    return succeeded, failed
+
+def print_counts(work_queue):
+    counts = work_queue.counts()
+    for status in (STATUS_PENDENTE, STATUS_EM_ANDAMENTO, STATUS_CONCLUIDO, STATUS_FALHOU):
+        print(f"{status:>14}: {counts.get(status, 0)}")
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Sakura Mangas Downloader - fila compartilhada entre processos e máquinas")
+    parser.add_argument('--fila', default=FILA_PATH, help="Banco SQLite da fila (pode estar em uma pasta compartilhada)")
+    commands = parser.add_subparsers(dest='comando', required=True)
+
+    fill = commands.add_parser('encher', help="Adiciona capítulos de links_caps.json ou links à fila")
+    fill.add_argument('entradas', nargs='+', help="Arquivos links_caps.json ou links de capítulos")
+    scheduler.add_arguments(fill)
+
+    work = commands.add_parser('trabalhar', help="Baixa capítulos da fila até ela esvaziar")
+    work.add_argument('--concessao', type=float, default=DURACAO_CONCESSAO,
+                      help="Duração de cada concessão em segundos (renovada enquanto o capítulo baixa)")
+    cap.add_download_arguments(work)
+
+    commands.add_parser('status', help="Mostra quantos capítulos há em cada estado")
+    commands.add_parser('repetir', help="Devolve à fila os capítulos que falharam")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args(sys.argv[1:])
+    work_queue = WorkQueue(args.fila)
+
+    if args.comando == 'encher':
+        scheduler.configure_from_args(args)
+        inputs = [item.strip() for arg in args.entradas for item in arg.split(',') if item.strip()]
+        added = work_queue.add(scheduler.collect_jobs(inputs))
+        print(f"{added} capítulo(s) adicionado(s) à fila")
+        print_counts(work_queue)
+    elif args.comando == 'trabalhar':
+        cap.configure_download(args)
+        try:
+            succeeded, failed = run_worker(work_queue, args.capitulos, args.concessao)
+        finally:
+            metrics.finish(args)
+        sys.exit(1 if failed else 0)
+    elif args.comando == 'repetir':
+        print(f"{work_queue.retry_failed()} capítulo(s) devolvido(s) à fila")
+        print_counts(work_queue)
+    else:
+        print_counts(work_queue)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,14 @@
 import os
-import subprocess
 import sys
 import glob
 
+# Os módulos de code/ são importados diretamente, sem abrir novos processos
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'code'))
+
+import cap
+import library
+import manga
+
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
@@ -30,15 +36,13 @@ def download_chapters():
         return
     
     # Limpar os links (remover espaços extras)
-    links_list = [link.strip() for link in links.split(',')]
-    processed_links = ",".join(links_list)
+    links_list = [link.strip() for link in links.split(',') if link.strip()]
     
-    # Executar o script cap.py
-    command = f'python code/cap.py {processed_links}'
+    # Baixa os capítulos no próprio processo
     try:
-        subprocess.run(command, shell=True, check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Erro ao executar o script cap.py: {e}")
+        cap.download_chapters(links_list)
+    except Exception as e:
+        print(f"Erro ao baixar os capítulos: {e}")
     finally:
         input("\nProcesso concluído. Pressione Enter para voltar ao menu...")
 
@@ -62,35 +66,42 @@ def download_complete_manga():
     for link in links:
         print(f"\nProcessando URL: {link}")
         try:
-            command = f'python code/manga.py "{link}"'
-            result = subprocess.run(command, shell=True, check=True)
-            
-            if result.returncode == 0:
+            if manga.fetch_catalog(link):
                 print(f"Processamento de {link} concluído com sucesso!")
-        except subprocess.CalledProcessError as e:
-            print(f"Erro ao executar o script manga.py para {link}: {e}")
+            else:
+                print(f"Erro ao processar o mangá {link}")
         except Exception as e:
             print(f"Erro inesperado ao processar {link}: {e}")
     
-    # Buscar todos os arquivos JSON após processar todos os links
-    json_files.update(glob.glob('mangas/**/links_caps.json', recursive=True))
+    # Buscar os arquivos JSON no índice da biblioteca; bibliotecas antigas,
+    # ainda sem índice, são percorridas pelo glob
+    missing = {}
+    try:
+        json_files.update(library.links_files())
+        missing = library.missing_counts()
+    except Exception as e:
+        print(f"Erro ao ler o índice da biblioteca: {e}")
+    if not json_files:
+        json_files.update(glob.glob('mangas/**/links_caps.json', recursive=True))
     
     # Se arquivos JSON foram gerados, oferecer para baixar os capítulos
     if json_files:
         print("\nArquivos links_caps.json gerados com sucesso:")
         for json_file in sorted(json_files):  # Ordenados alfabeticamente
-            print(f"- {json_file}")
+            pending = missing.get(os.path.dirname(json_file))
+            if pending is None:
+                print(f"- {json_file}")
+            else:
+                print(f"- {json_file} ({pending} capítulo(s) faltando)")
         
         print("\nDeseja baixar todos os capítulos agora? (S/N)")
         choice = input("> ").strip().lower()
         
         if choice == 's':
-            json_paths = ",".join(sorted(json_files))  # Junta os paths sem duplicatas
-            print(f"\nExecutando: python code/cap.py {json_paths}")
             try:
-                subprocess.run(f'python code/cap.py "{json_paths}"', shell=True, check=True)
-            except subprocess.CalledProcessError as e:
-                print(f"Erro ao executar o script cap.py: {e}")
+                cap.download_chapters(sorted(json_files))  # Paths sem duplicatas
+            except Exception as e:
+                print(f"Erro ao baixar os capítulos: {e}")
     
     input("\nProcesso concluído. Pressione Enter para voltar ao menu...")
 
@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+
+import workqueue
+from workqueue import LeaseKeeper, WorkQueue
+
+
+class WorkQueueLeaseTest(unittest.TestCase):
+    """
+    Concessões da fila compartilhada: claim, renew e finish entre dois workers
+    """
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.queue = WorkQueue(os.path.join(self.tmp.name, 'fila.db'))
+        self.queue.add([{'link': 'https://exemplo/ler/cap-1'}])
+
+    def tearDown(self):
+        self.queue.connect().close()
+        self.tmp.cleanup()
+
+    def status(self):
+        return self.queue.connect().execute('SELECT status, worker FROM jobs').fetchone()
+
+    def test_valid_lease_is_not_claimed_twice(self):
+        self.assertEqual(len(self.queue.claim('a')), 1)
+        self.assertEqual(self.queue.claim('b'), [])
+
+    def test_stale_worker_cannot_overwrite_new_owner(self):
+        job_id = self.queue.claim('a', lease=-1)[0]['fila_id']
+        self.assertEqual(self.queue.claim('b')[0]['fila_id'], job_id)
+        self.assertEqual(self.queue.renew([job_id], 'a'), [])
+
+        self.assertFalse(self.queue.finish(job_id, 'a', False))
+        self.assertEqual(tuple(self.status()), (workqueue.STATUS_EM_ANDAMENTO, 'b'))
+
+        self.assertTrue(self.queue.finish(job_id, 'b', True))
+        self.assertFalse(self.queue.finish(job_id, 'a', False))
+        self.assertEqual(self.status()['status'], workqueue.STATUS_CONCLUIDO)
+
+    def test_failure_returns_to_queue_until_attempts_run_out(self):
+        for attempt in range(workqueue.TENTATIVAS_MAXIMAS):
+            job_id = self.queue.claim('a')[0]['fila_id']
+            self.assertTrue(self.queue.finish(job_id, 'a', False))
+        self.assertEqual(self.status()['status'], workqueue.STATUS_FALHOU)
+        self.assertEqual(self.queue.claim('a'), [])
+
+    def test_expired_lease_on_last_attempt_fails(self):
+        for attempt in range(workqueue.TENTATIVAS_MAXIMAS):
+            self.queue.claim('a', lease=-1)
+        self.assertEqual(self.queue.claim('b'), [])
+        self.assertEqual(self.status()['status'], workqueue.STATUS_FALHOU)
+
+    def test_keeper_reports_lost_lease(self):
+        job_id = self.queue.claim('a', lease=-1)[0]['fila_id']
+        keeper = LeaseKeeper(self.queue, 'a')
+        keeper.add(job_id)
+        self.queue.claim('b')
+        self.assertFalse(keeper.owns(job_id))
+
+        self.queue.add([{'link': 'https://exemplo/ler/cap-2'}])
+        second = self.queue.claim('a')[0]['fila_id']
+        keeper.add(second)
+        self.assertTrue(keeper.owns(second))
+
+
+if __name__ == '__main__':
+    unittest.main()